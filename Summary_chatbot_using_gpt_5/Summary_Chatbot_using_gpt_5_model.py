@@ -1,16 +1,46 @@
-from openai import OpenAI
+import asyncio
+import os
+import random
+from openai import AsyncOpenAI, RateLimitError, APIConnectionError, APIStatusError, InternalServerError
 from dotenv import load_dotenv
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
 load_dotenv()
 
+# Chunk budget per model, in tokens. A few thousand tokens per request keeps
+# the system prompt a small share of each call while leaving the model room
+# to summarize the chunk in detail.
+CHUNK_TOKENS = {'openai/gpt-5-chat': 4000}
+DEFAULT_CHUNK_TOKENS = 2000
+
+# tiktoken encoding per model; OpenRouter model names are not known to tiktoken
+MODEL_ENCODINGS = {'openai/gpt-5-chat': 'o200k_base'}
+
 class GptOssChatbot:
     def __init__(self):
         self.model='openai/gpt-5-chat'
-        self.client=OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=""
-        )
+        self.base_url="https://openrouter.ai/api/v1"
+        self.api_key=""
+        
+        # chunk summaries in flight at once, and how often a 429 is retried
+        self.max_concurrency=int(os.getenv('CHUNK_MAX_CONCURRENCY', 8))
+        self.max_retries=int(os.getenv('CHUNK_MAX_RETRIES', 6))
+        self.backoff_base=float(os.getenv('CHUNK_BACKOFF_BASE', 1.0))
+        self.backoff_max=float(os.getenv('CHUNK_BACKOFF_MAX', 60.0))
+        
+        # final-summary reduce: summaries merged per call, and the token budget of one call's input
+        self.reduce_fan_in=max(2,int(os.getenv('REDUCE_FAN_IN', 16)))
+        self.reduce_input_tokens=int(os.getenv('REDUCE_INPUT_TOKENS', 32000))
+        
+        # content_splitter packs chunks up to chunk_tokens, overlapping by chunk_overlap_ratio of that
+        self.chunk_tokens=int(os.getenv('CHUNK_TOKENS', CHUNK_TOKENS.get(self.model,DEFAULT_CHUNK_TOKENS)))
+        self.chunk_overlap_ratio=float(os.getenv('CHUNK_OVERLAP_RATIO', 0.05))
+        self.encoding=self.load_encoding()
         
         self.tokens_history=[]
         
@@ -39,6 +69,25 @@ class GptOssChatbot:
                     """}]
             return chunk_summary_prompt
         
+        elif prompt_name=='group_summary':
+            group_summary_prompt = [{'role': 'assistant', 'content': """
+                            #Role:
+                                You are an expert summarizer with 10 years of experience integrating multi-part content.
+                            
+                            #Objective:
+                                Your goal is to merge a group of consecutive partial summaries of one document into a single summary of that part.
+                            
+                            #Context:
+                                Do not hallucinate. Preserve meaning, nuance, and important insights. The result will be merged again with other groups, so keep every key point.
+                            
+                            #Instructions:
+                                1. You will receive several numbered summaries, in document order.
+                                2. Combine them into one clear, well-structured summary with a heading and bullet points, around 200–400 words.
+                                3. Keep key arguments, evidence, figures, names and conclusions; drop repetition between the summaries.
+                                4. Do not produce an overall summary of the whole document.
+                    """}]
+            return group_summary_prompt
+        
         else:
             overall_summary_prompt = [{'role': 'assistant', 'content': """
                             #Role:
@@ -59,11 +108,25 @@ class GptOssChatbot:
                     """}]
             return overall_summary_prompt
         
+    def load_encoding(self):
+        if tiktoken is None:
+            return None
+        try:
+            return tiktoken.get_encoding(MODEL_ENCODINGS.get(self.model,'o200k_base'))
+        except Exception as e:
+            # the encoding files are downloaded on first use
+            print(f"tiktoken encoding unavailable, estimating tokens from length: {e}")
+            return None
+    
     def content_splitter(self,text):
+        # Sizes are measured in tokens; paragraphs are kept whole when they
+        # fit, then sentences, then words
         text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,
-            chunk_overlap=100,
-            separators=["\n\n", "\n", " ", ""]
+            chunk_size=self.chunk_tokens,
+            chunk_overlap=int(self.chunk_tokens*self.chunk_overlap_ratio),
+            separators=["\n\n", "\n", ". ", "? ", "! ", "; ", " ", ""],
+            keep_separator="end",
+            length_function=self.count_tokens
         )
         
         chunks = text_splitter.split_text(text)
@@ -73,66 +136,157 @@ class GptOssChatbot:
     
     def llm_invoking(self,user_input):
         final_chunk_text=self.content_splitter(user_input)
-        prompt = self.fetchPrompts('chunk_summary')
         
-        chunk_summary=[]
+        chunk_summary=asyncio.run(self.chunk_summaries(final_chunk_text))
         
-        for i,chunk in enumerate(final_chunk_text,1):
-            prompt.append({'role':'user','content':f"Chunk: {i} | Content: {chunk}"})
-            
-            # print("\n"+f"Chunk {i}")
-            
-            llm_response=self.client.chat.completions.create(
-                model=self.model,
-                messages=prompt,
-                max_tokens=2000,
-                temperature=0.7
-            )
-            
-            input_tokens = llm_response.usage.prompt_tokens
-            output_tokens=llm_response.usage.completion_tokens
-            total_tokens=llm_response.usage.total_tokens
-            
-            tokens_data = f"input tokens: {input_tokens} | output tokens: {output_tokens} | total tokens: {total_tokens}"
+        final_summary_response = self.final_summary_invoking(chunk_summary)
+        
+        return final_summary_response
+    
+    async def chunk_summaries(self,chunks):
+        # Map phase: every chunk is summarized concurrently, at most
+        # max_concurrency requests in flight; gather keeps chunk order.
+        # The client is opened per run because asyncio.run closes its loop.
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with AsyncOpenAI(base_url=self.base_url,api_key=self.api_key,max_retries=0) as client:
+            results = await self.gather_or_cancel(self.summarize_chunk(client,semaphore,i,chunk)
+                                                  for i,chunk in enumerate(chunks,1))
+        
+        chunk_summary=[]
+        for chunk,(response,tokens_data) in zip(chunks,results):
             self.tokens_history.append({'Chunk':chunk,'model_conumption':tokens_data})
-            
-            response = llm_response.choices[0].message.content
-            
-            
             chunk_summary.append(response)
-            
-            prompt.pop(1)
-            
+        return chunk_summary
+    
+    async def summarize_chunk(self,client,semaphore,i,chunk):
+        prompt = self.fetchPrompts('chunk_summary')
+        prompt.append({'role':'user','content':f"Chunk: {i} | Content: {chunk}"})
         
-        final_summary_response = self.final_summary_invoking(chunk_summary)
+        response,usage=await self.complete(client,semaphore,prompt,2000,f"Chunk {i}")
+        return response,self.tokens_text(*usage)
+    
+    async def gather_or_cancel(self,coros):
+        # like gather, but the first failure cancels the requests still running
+        tasks=[asyncio.ensure_future(coro) for coro in coros]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks,return_exceptions=True)
+            raise
+    
+    def retryable(self,error):
+        # what the SDK's own retries cover: 429, 408, 5xx, connection errors and timeouts
+        if isinstance(error,(RateLimitError,InternalServerError,APIConnectionError)):
+            return True
+        return isinstance(error,APIStatusError) and error.status_code==408
+    
+    async def complete(self,client,semaphore,prompt,max_tokens,label):
+        # one chat completion under the in-flight limit, retried on 429,
+        # 408, 5xx and connection errors (the client's own retries are off
+        # so the backoff holds the slot); returns the reply and
+        # (input, output, total) tokens
+        async with semaphore:
+            for attempt in range(self.max_retries+1):
+                try:
+                    llm_response=await client.chat.completions.create(
+                        model=self.model,
+                        messages=prompt,
+                        max_tokens=max_tokens,
+                        temperature=0.7
+                    )
+                    break
+                except (APIConnectionError,APIStatusError) as e:
+                    if not self.retryable(e) or attempt==self.max_retries:
+                        raise
+                    delay=self.retry_delay(e,attempt)
+                    print(f"{label} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                    # the slot stays held, so a 429 also slows the other requests down
+                    await asyncio.sleep(delay)
         
-        return final_summary_response
+        usage = llm_response.usage
+        return llm_response.choices[0].message.content,(usage.prompt_tokens,usage.completion_tokens,usage.total_tokens)
+    
+    def tokens_text(self,input_tokens,output_tokens,total_tokens):
+        return f"input tokens: {input_tokens} | output tokens: {output_tokens} | total tokens: {total_tokens}"
+    
+    def retry_delay(self,error,attempt):
+        # honour the provider's Retry-After, else exponential backoff with full jitter
+        response=getattr(error,'response',None)
+        retry_after=response.headers.get('retry-after') if response is not None else None
+        try:
+            return min(float(retry_after),self.backoff_max)
+        except (TypeError,ValueError):
+            return random.uniform(0,min(self.backoff_max,self.backoff_base*2**attempt))
+    
+    def count_tokens(self,text):
+        if self.encoding is not None:
+            return len(self.encoding.encode(text,disallowed_special=()))
+        # about four characters per token for English text
+        return -(-len(text)//4)
     
     def final_summary_invoking(self,chunk_summary):
         print("Finall summary invoking....................")
         
-        content = "\n".join(chunk_summary)
-        prompt = self.fetchPrompts('overall_summary')
-        
-        prompt.append({'role':'user','content':f"All chunk summarize: {content}"})
+        return asyncio.run(self.reduce_summaries(chunk_summary))
+    
+    async def reduce_summaries(self,summaries):
+        # Tree reduce: while the summaries are too many (reduce_fan_in) or too
+        # long (reduce_input_tokens) for one final prompt, they are packed into
+        # groups that fit, every group is merged in parallel, and the merged
+        # summaries become the next level. Each level's usage goes to tokens_history.
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with AsyncOpenAI(base_url=self.base_url,api_key=self.api_key,max_retries=0) as client:
+            level=0
+            while len(summaries)>1 and (len(summaries)>self.reduce_fan_in or
+                                        self.count_tokens("\n".join(summaries))>self.reduce_input_tokens):
+                level+=1
+                groups=self.group_summaries(summaries)
+                results=await self.gather_or_cancel(self.merge_group(client,semaphore,level,i,group)
+                                                    for i,group in enumerate(groups,1))
+                summaries=[response for response,_ in results]
+                
+                usage=[sum(tokens) for tokens in zip(*(usage for _,usage in results))]
+                tokens_data=self.tokens_text(*usage)
+                print(f"Reduce level {level}: {len(groups)} groups | {tokens_data}")
+                self.tokens_history.append({'Chunk':f"Reduce level {level} ({len(groups)} groups)",'model_conumption':tokens_data})
             
-        llm_response=self.client.chat.completions.create(
-            model=self.model,
-            messages=prompt,
-            max_tokens=3000,
-            temperature=0.7
-        )
-        
-        input_tokens = llm_response.usage.prompt_tokens
-        output_tokens=llm_response.usage.completion_tokens
-        total_tokens=llm_response.usage.total_tokens
-        
-        tokens_data = f"input tokens: {input_tokens} | output tokens: {output_tokens} | total tokens: {total_tokens}"
-        self.tokens_history.append({'Chunk':"All chunks",'model_conumption':tokens_data})
-        
-        response = llm_response.choices[0].message.content
+            content = "\n".join(summaries)
+            prompt = self.fetchPrompts('overall_summary')
+            prompt.append({'role':'user','content':f"All chunk summarize: {content}"})
+            
+            response,usage=await self.complete(client,semaphore,prompt,3000,"Final summary")
         
+        self.tokens_history.append({'Chunk':"All chunks",'model_conumption':self.tokens_text(*usage)})
         return response
+    
+    def group_summaries(self,summaries):
+        # consecutive summaries, at most reduce_fan_in per group and within
+        # reduce_input_tokens; a group takes at least two when it can, so every level shrinks
+        groups=[]
+        group=[]
+        group_tokens=0
+        for summary in summaries:
+            tokens=self.count_tokens(summary)
+            if len(group)==self.reduce_fan_in or (len(group)>=2 and group_tokens+tokens>self.reduce_input_tokens):
+                groups.append(group)
+                group,group_tokens=[],0
+            group.append(summary)
+            group_tokens+=tokens
+        if group:
+            groups.append(group)
+        return groups
+    
+    async def merge_group(self,client,semaphore,level,i,group):
+        if len(group)==1:
+            # a leftover summary moves up a level as it is
+            return group[0],(0,0,0)
+        content = "\n".join(f"Summary {n}: {summary}" for n,summary in enumerate(group,1))
+        prompt = self.fetchPrompts('group_summary')
+        prompt.append({'role':'user','content':f"Level: {level} | Group: {i} | {content}"})
+        
+        return await self.complete(client,semaphore,prompt,2000,f"Level {level} group {i}")
             
     
     def main(self):
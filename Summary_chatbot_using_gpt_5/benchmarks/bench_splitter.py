@@ -0,0 +1,207 @@
+"""Compares the old 500-character splitter with the token-budget splitter.
+
+Each splitter's chunks go through the chatbot's real map phase and tree
+reduce (chunk_summaries, reduce_summaries) against a stand-in
+OpenAI-compatible server on localhost. The server bills prompt tokens
+with the chatbot's own count_tokens, returns --completion-tokens per
+reply and sleeps for a latency built from time to first token, prefill
+rate and output rate. For each corpus size the script reports request
+count, prompt/completion/total tokens billed, split time and wall-clock
+time.
+
+The reference corpus is generated from a fixed seed: paragraphs of
+varied sentences, about the shape of a report. Pass --corpus to use your
+own text files instead.
+
+    python benchmarks/bench_splitter.py
+    python benchmarks/bench_splitter.py --sizes-kb 50,500 --concurrency 16
+    python benchmarks/bench_splitter.py --corpus book.txt --output results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(bench_dir))
+
+import uvicorn
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from Summary_Chatbot_using_gpt_5_model import GptOssChatbot
+
+words = ("revenue margin supplier contract quarter delivery forecast region customer pricing "
+         "inventory logistics audit compliance budget headcount churn renewal pipeline risk "
+         "warehouse freight invoice discount partner roadmap release incident outage capacity").split()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# ---- stand-in chat completions server ------------------------------------------
+
+class billing:
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def report(self):
+        return {"requests": self.requests, "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "total_tokens": self.prompt_tokens + self.completion_tokens}
+
+
+def fake_openai_app(bot, usage, args):
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+
+    async def chat(request):
+        body = await request.json()
+        # chat templates add a few tokens per message
+        prompt_tokens = sum(bot.count_tokens(message["content"]) + 4 for message in body["messages"])
+        completion_tokens = min(args.completion_tokens, body.get("max_tokens") or args.completion_tokens)
+        await asyncio.sleep(args.latency + prompt_tokens / args.prefill_tokens_per_second
+                            + completion_tokens / args.tokens_per_second)
+        usage.requests += 1
+        usage.prompt_tokens += prompt_tokens
+        usage.completion_tokens += completion_tokens
+        content = " ".join(random.Random(body["messages"][-1]["content"]).choices(words, k=int(completion_tokens * 0.75)))
+        return JSONResponse({"id": "bench", "object": "chat.completion", "created": int(time.time()),
+                             "model": body["model"],
+                             "choices": [{"index": 0, "finish_reason": "stop",
+                                          "message": {"role": "assistant", "content": content}}],
+                             "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                       "total_tokens": prompt_tokens + completion_tokens}})
+
+    return Starlette(routes=[Route("/v1/chat/completions", chat, methods=["POST"])])
+
+
+def start_in_thread(app, port):
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+# ---- corpus --------------------------------------------------------------------
+
+def reference_corpus(size_kb, seed):
+    rng = random.Random(f"{seed}-{size_kb}")
+    paragraphs = []
+    size = 0
+    while size < size_kb * 1024:
+        sentences = []
+        for _ in range(rng.randint(2, 8)):
+            sentence = " ".join(rng.choices(words, k=rng.randint(6, 28)))
+            sentences.append(sentence.capitalize() + rng.choice([".", ".", ".", "?", ";"]))
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def legacy_splitter(text):
+    # content_splitter before the token budget
+    return RecursiveCharacterTextSplitter(
+        chunk_size=500,
+        chunk_overlap=100,
+        separators=["\n\n", "\n", " ", ""]
+    ).split_text(text)
+
+
+# ---- runs ----------------------------------------------------------------------
+
+async def summarize(bot, chunks):
+    chunk_summary = await bot.chunk_summaries(chunks)
+    return await bot.reduce_summaries(chunk_summary)
+
+
+def run_splitter(bot, usage, name, splitter, text):
+    usage.__init__()
+    started = time.perf_counter()
+    chunks = splitter(text)
+    split_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    asyncio.run(summarize(bot, chunks))
+    elapsed = time.perf_counter() - started
+
+    chunk_tokens = [bot.count_tokens(chunk) for chunk in chunks]
+    return {"splitter": name, "chunks": len(chunks),
+            "mean_chunk_tokens": round(sum(chunk_tokens) / len(chunks), 1),
+            "content_tokens_sent": sum(chunk_tokens),
+            "source_tokens": bot.count_tokens(text),
+            **usage.report(),
+            "split_ms": round(split_ms, 2), "wall_clock_s": round(elapsed, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes-kb", default="50,200", help="comma separated generated corpus sizes")
+    parser.add_argument("--corpus", nargs="*", default=None, help="text files to use instead of the generated corpus")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.1, help="stand-in time to first token, seconds")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=20000)
+    parser.add_argument("--tokens-per-second", type=float, default=400)
+    parser.add_argument("--completion-tokens", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None, help="write the results as JSON")
+    args = parser.parse_args()
+
+    port = free_port()
+    bot = GptOssChatbot()
+    bot.base_url = f"http://127.0.0.1:{port}/v1"
+    bot.api_key = "bench"
+    bot.max_concurrency = args.concurrency
+    usage = billing()
+    server = start_in_thread(fake_openai_app(bot, usage, args), port)
+
+    if args.corpus:
+        corpora = []
+        for path in args.corpus:
+            with open(path, encoding="utf-8") as source:
+                corpora.append((os.path.basename(path), source.read()))
+    else:
+        corpora = [(f"generated {size} KB", reference_corpus(int(size), args.seed)) for size in args.sizes_kb.split(",")]
+
+    results = []
+    try:
+        for name, text in corpora:
+            for splitter_name, splitter in (("chars_500", legacy_splitter), ("token_budget", bot.content_splitter)):
+                result = run_splitter(bot, usage, splitter_name, splitter, text)
+                results.append({"corpus": name, "bytes": len(text.encode("utf-8")), **result})
+    finally:
+        server.should_exit = True
+
+    print(f"tokenizer: {'tiktoken' if bot.encoding is not None else 'length estimate'} | "
+          f"chunk budget {bot.chunk_tokens} tokens, overlap {bot.chunk_overlap_ratio:.0%}")
+    print(f"{'corpus':<20}{'splitter':<14}{'requests':>9}{'prompt tok':>12}{'total tok':>12}{'split ms':>10}{'wall s':>9}")
+    for result in results:
+        print(f"{result['corpus']:<20}{result['splitter']:<14}{result['requests']:>9}{result['prompt_tokens']:>12}"
+              f"{result['total_tokens']:>12}{result['split_ms']:>10.1f}{result['wall_clock_s']:>9.2f}")
+
+    if args.output:
+        with open(args.output, "w") as target:
+            json.dump({"benchmark": "chunk_splitter",
+                       "created_at": datetime.now(timezone.utc).isoformat(),
+                       "settings": {key: value for key, value in vars(args).items() if key != "output"},
+                       "tokenizer": "tiktoken" if bot.encoding is not None else "estimate",
+                       "chunk_tokens": bot.chunk_tokens, "chunk_overlap_ratio": bot.chunk_overlap_ratio,
+                       "results": results}, target, indent=2)
+        print(f"results: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
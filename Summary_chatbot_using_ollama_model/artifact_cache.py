@@ -0,0 +1,163 @@
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+import config
+
+
+class artifactCache:
+    """Size-bounded LRU/TTL cache for rendered summary files.
+
+    Keys are (summary_id, format). Entries evicted from the memory tier are
+    spilled to ARTIFACT_SPILL_DIR when it is set; the disk tier has its own
+    byte budget and removes files as they age out, so nothing accumulates.
+    Expired entries are dropped, never spilled. The lock only guards the
+    bookkeeping; spill writes and disk reads happen outside it.
+    """
+
+    def __init__(self,maxBytes=config.ARTIFACT_CACHE_BYTES,ttl=config.ARTIFACT_CACHE_TTL,
+                 spillDir=config.ARTIFACT_SPILL_DIR,spillBytes=config.ARTIFACT_SPILL_BYTES):
+        self.maxBytes=maxBytes
+        self.ttl=ttl
+        self.spillBytes=spillBytes
+        self.spillDir=tempfile.mkdtemp(prefix='summary_artifacts_',dir=spillDir) if spillDir else None
+        self.memory=OrderedDict()
+        self.disk=OrderedDict()
+        self.memorySize=0
+        self.diskSize=0
+        self.lock=threading.Lock()
+        self.spillIds=itertools.count()
+        self.hits=0
+        self.diskHits=0
+        self.misses=0
+
+    def put(self,summaryId,userId,fmt,data):
+        key=(str(summaryId),fmt)
+        now=time.monotonic()
+        spills=[]
+        with self.lock:
+            stale=self.dropLocked(key)+self.expireLocked(now)
+            if len(data)>self.maxBytes:
+                spills.append((key,str(userId),data,now))
+            else:
+                self.memory[key]=(str(userId),data,now)
+                self.memorySize+=len(data)
+                while self.memorySize>self.maxBytes:
+                    oldKey,(oldUser,oldData,created)=self.memory.popitem(last=False)
+                    self.memorySize-=len(oldData)
+                    spills.append((oldKey,oldUser,oldData,created))
+        self.removeFiles(stale)
+        for spill in spills:
+            self.spill(*spill)
+
+    def get(self,summaryId,fmt):
+        """Returns (user_id, bytes) or None."""
+        key=(str(summaryId),fmt)
+        now=time.monotonic()
+        with self.lock:
+            entry=self.memory.get(key)
+            if entry and now-entry[2]<=self.ttl:
+                self.memory.move_to_end(key)
+                self.hits+=1
+                return entry[0],entry[1]
+            spilled=self.disk.get(key)
+            if not spilled or now-spilled[2]>self.ttl:
+                stale=self.dropLocked(key)
+                self.misses+=1
+                spilled=None
+        if spilled is None:
+            self.removeFiles(stale)
+            return None
+
+        try:
+            with open(spilled[1],'rb') as artifact:
+                data=artifact.read()
+        except OSError:
+            data=None
+        with self.lock:
+            if data is None:
+                if self.disk.get(key) is spilled:
+                    self.disk.pop(key)
+                    self.diskSize-=spilled[3]
+                self.misses+=1
+                return None
+            if key in self.disk:
+                self.disk.move_to_end(key)
+            self.diskHits+=1
+        return spilled[0],data
+
+    def spill(self,key,userId,data,created):
+        # written outside the lock; an entry that expired or was stored
+        # again meanwhile (same summary, same bytes) makes the file redundant
+        if not self.spillDir or len(data)>self.spillBytes or time.monotonic()-created>self.ttl:
+            return
+        path=os.path.join(self.spillDir,f"{key[0]}.{key[1]}.{next(self.spillIds)}")
+        try:
+            with open(path,'wb') as artifact:
+                artifact.write(data)
+        except OSError:
+            self.removeFiles([path])
+            return
+        stale=[]
+        with self.lock:
+            if key in self.memory or key in self.disk:
+                stale.append(path)
+            else:
+                self.disk[key]=(userId,path,created,len(data))
+                self.diskSize+=len(data)
+                while self.diskSize>self.spillBytes:
+                    oldKey,(_,oldPath,_,size)=self.disk.popitem(last=False)
+                    self.diskSize-=size
+                    stale.append(oldPath)
+        self.removeFiles(stale)
+
+    def expireLocked(self,now):
+        """Drops entries past their TTL; returns their files for removeFiles."""
+        for key in [key for key,entry in self.memory.items() if now-entry[2]>self.ttl]:
+            self.memorySize-=len(self.memory.pop(key)[1])
+        stale=[]
+        for key in [key for key,entry in self.disk.items() if now-entry[2]>self.ttl]:
+            _,path,_,size=self.disk.pop(key)
+            self.diskSize-=size
+            stale.append(path)
+        return stale
+
+    def dropLocked(self,key):
+        """Forgets key; returns its spilled file, if any, for removeFiles."""
+        entry=self.memory.pop(key,None)
+        if entry:
+            self.memorySize-=len(entry[1])
+        spilled=self.disk.pop(key,None)
+        if spilled:
+            self.diskSize-=spilled[3]
+            return [spilled[1]]
+        return []
+
+    def removeFiles(self,paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self.disk.clear()
+            self.memorySize=0
+            self.diskSize=0
+        if self.spillDir:
+            shutil.rmtree(self.spillDir,ignore_errors=True)
+            os.makedirs(self.spillDir,exist_ok=True)
+
+    def stats(self):
+        with self.lock:
+            return {"memory_entries":len(self.memory),"memory_bytes":self.memorySize,"max_memory_bytes":self.maxBytes,
+                    "disk_entries":len(self.disk),"disk_bytes":self.diskSize,"max_disk_bytes":self.spillBytes if self.spillDir else 0,
+                    "memory_hits":self.hits,"disk_hits":self.diskHits,"misses":self.misses}
+
+
+artifactStore=artifactCache()
@@ -0,0 +1,449 @@
+"""Load test for the summary API against a stand-in Ollama.
+
+Starts a fake Ollama (configurable first-token latency and tokens/sec),
+runs the FastAPI app in a child process pointed at it, then drives
+concurrent mixed uploads (pdf/docx/csv/xlsx/txt in several sizes) at
+POST /summary and reports RPS, p50/p95/p99 latency and the server's peak
+RSS. History rows go to an in-memory store unless --postgres is given, in
+which case the usual DB_* settings are used. The fake Ollama also serves
+/api/embed, so the vector index embeds and appends as it would in
+production.
+
+Results are written as JSON to benchmarks/results/; pass an earlier file
+as --baseline to print the change and flag regressions.
+
+    python benchmarks/bench_load.py --concurrency 8 --requests 200
+    python benchmarks/bench_load.py --baseline benchmarks/results/load_20261018T120000.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime,timezone
+from io import BytesIO
+
+benchDir=os.path.dirname(os.path.abspath(__file__))
+appDir=os.path.dirname(benchDir)
+sys.path.insert(0,appDir)
+
+import httpx
+import uvicorn
+
+sizes={"small":5,"medium":60,"large":400}
+fileTypes=["pdf","docx","csv","xlsx","txt"]
+embeddingDims=256
+sentence="The vendor agreement covers pricing, delivery windows and service levels for the coming quarter. "
+
+
+def freePort():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1",0))
+        return sock.getsockname()[1]
+
+
+# ---- stand-in Ollama -------------------------------------------------------
+
+def fakeOllamaApp(latency,tokensPerSecond,completionTokens):
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse,StreamingResponse
+    from starlette.routing import Route
+
+    def now():
+        return datetime.now(timezone.utc).isoformat()
+
+    async def chat(request):
+        body=await request.json()
+        promptChars=sum(len(message.get("content") or "") for message in body.get("messages",[]))
+        model=body.get("model","fake")
+
+        async def tokens():
+            started=time.perf_counter()
+            await asyncio.sleep(latency)
+            for i in range(completionTokens):
+                await asyncio.sleep(1/tokensPerSecond)
+                text="# Summary\n" if i==0 else ("- point " if i%12==1 else "word ")
+                yield {"model":model,"created_at":now(),"message":{"role":"assistant","content":text},"done":False}
+            yield {"model":model,"created_at":now(),"message":{"role":"assistant","content":""},
+                   "done":True,"done_reason":"stop","prompt_eval_count":promptChars//4,"eval_count":completionTokens,
+                   "total_duration":int((time.perf_counter()-started)*1e9)}
+
+        if body.get("stream",True):
+            async def lines():
+                async for chunk in tokens():
+                    yield json.dumps(chunk)+"\n"
+            return StreamingResponse(lines(),media_type="application/x-ndjson")
+
+        parts=[]
+        async for chunk in tokens():
+            parts.append(chunk["message"]["content"])
+        chunk["message"]["content"]="".join(parts)
+        return JSONResponse(chunk)
+
+    async def generate(request):
+        body=await request.json()
+        return JSONResponse({"model":body.get("model","fake"),"created_at":now(),"response":"","done":True})
+
+    async def ps(request):
+        return JSONResponse({"models":[]})
+
+    async def embed(request):
+        # deterministic pseudo-embeddings, so repeated texts get the same vector
+        body=await request.json()
+        texts=body["input"] if isinstance(body["input"],list) else [body["input"]]
+        vectors=[]
+        for text in texts:
+            rng=random.Random(text)
+            vectors.append([rng.uniform(-1,1) for _ in range(embeddingDims)])
+        return JSONResponse({"model":body.get("model","fake"),"embeddings":vectors})
+
+    return Starlette(routes=[Route("/api/chat",chat,methods=["POST"]),
+                             Route("/api/generate",generate,methods=["POST"]),
+                             Route("/api/ps",ps,methods=["GET"]),
+                             Route("/api/embed",embed,methods=["POST"])])
+
+
+def startInThread(app,port):
+    server=uvicorn.Server(uvicorn.Config(app,host="127.0.0.1",port=port,log_level="warning"))
+    thread=threading.Thread(target=server.run,daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+# ---- app under test (child process) ----------------------------------------
+
+class memoryDb:
+    """Stands in for postgresDb/asyncPostgresDb: writes are counted, reads
+    find nothing, so every request takes the full summary path."""
+
+    rows=0
+    lock=threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self,*exc):
+        return False
+
+    def disconnect(self):
+        pass
+
+    def showData(self,query,val=None):
+        return []
+
+    def create(self,query):
+        return {"data":'created',"status code":200}
+
+    def insertData(self,query,val=None):
+        with memoryDb.lock:
+            memoryDb.rows+=1
+        return {"data":'insert data successfully',"status code":200}
+
+    def insertBatch(self,statements,copy=None,before=()):
+        with memoryDb.lock:
+            memoryDb.rows+=sum(len(rows) for _,rows in statements)+(len(copy[2]) if copy else 0)
+        return {"data":'insert data successfully',"status code":200}
+
+    def deleteData(self,query,val=None):
+        return {"data":'delete data successfully',"status code":200}
+
+    def updateData(self,query,val=None):
+        return {"data":'update data successfully',"status code":200}
+
+
+class asyncMemoryDb(memoryDb):
+    # same methods, awaitable
+    async def showData(self,query,val=None):
+        return memoryDb.showData(self,query,val)
+
+    async def create(self,query):
+        return memoryDb.create(self,query)
+
+    async def insertData(self,query,val=None):
+        return memoryDb.insertData(self,query,val)
+
+    async def insertBatch(self,statements,copy=None,before=()):
+        return memoryDb.insertBatch(self,statements,copy,before)
+
+    async def deleteData(self,query,val=None):
+        return memoryDb.deleteData(self,query,val)
+
+    async def updateData(self,query,val=None):
+        return memoryDb.updateData(self,query,val)
+
+
+def serve(port,usePostgres):
+    import main
+    if not usePostgres:
+        import history_writer,schema,service,session_cache,summary_cache,vector_index
+        schema.postgresDb=memoryDb
+        service.postgresDb=memoryDb
+        for module in (history_writer,service,session_cache,summary_cache,vector_index):
+            module.asyncPostgresDb=asyncMemoryDb
+    uvicorn.run(main.app,host="127.0.0.1",port=port,log_level="warning")
+
+
+# ---- upload corpus -----------------------------------------------------------
+
+def paragraphs(count,nonce):
+    return [f"Paragraph {i} ({nonce}). "+sentence*6 for i in range(count)]
+
+
+def makeTxt(count,nonce):
+    return "\n\n".join(paragraphs(count,nonce)).encode("utf-8")
+
+
+def makeDocx(count,nonce):
+    from docx import Document
+    doc=Document()
+    for text in paragraphs(count,nonce):
+        doc.add_paragraph(text)
+    buffer=BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def makePdf(count,nonce):
+    from fpdf import FPDF
+    pdf=FPDF()
+    pdf.set_font("Helvetica",size=10)
+    pdf.add_page()
+    for text in paragraphs(count,nonce):
+        pdf.multi_cell(0,5,text,new_x="LMARGIN",new_y="NEXT")
+    return bytes(pdf.output())
+
+
+def tableFrame(count,nonce):
+    import pandas as pd
+    rng=random.Random(nonce)
+    rows=count*25
+    return pd.DataFrame({"order_id":range(rows),
+                         "region":[rng.choice(["north","south","east","west"]) for _ in range(rows)],
+                         "amount":[round(rng.uniform(5,500),2) for _ in range(rows)],
+                         "note":[f"{nonce} item {i}" for i in range(rows)]})
+
+
+def makeCsv(count,nonce):
+    return tableFrame(count,nonce).to_csv(index=False).encode("utf-8")
+
+
+def makeXlsx(count,nonce):
+    buffer=BytesIO()
+    tableFrame(count,nonce).to_excel(buffer,index=False)
+    return buffer.getvalue()
+
+
+builders={"pdf":makePdf,"docx":makeDocx,"csv":makeCsv,"xlsx":makeXlsx,"txt":makeTxt}
+
+
+def buildUploads(total,unique,seed):
+    """The request mix, built before the clock starts: types and sizes in
+    rotation. With unique=False each (type, size) upload is reused so
+    repeats hit the summary cache."""
+    mix=[(fileType,size) for fileType in fileTypes for size in sizes]
+    built={}
+    uploads=[]
+    for index in range(total):
+        fileType,size=mix[index%len(mix)]
+        nonce=f"{seed}-{fileType}-{size}"+(f"-{index}" if unique else "")
+        if nonce not in built:
+            built[nonce]=builders[fileType](sizes[size],nonce)
+        uploads.append({"type":fileType,"size":size,"data":built[nonce]})
+    return uploads
+
+
+# ---- load driver -------------------------------------------------------------
+
+def percentile(samples,fraction):
+    if not samples:
+        return None
+    samples=sorted(samples)
+    return samples[min(len(samples)-1,int(len(samples)*fraction))]
+
+
+def latencySummary(samples):
+    return {"count":len(samples),
+            "mean_ms":round(statistics.mean(samples),2) if samples else None,
+            "p50_ms":round(percentile(samples,0.50),2) if samples else None,
+            "p95_ms":round(percentile(samples,0.95),2) if samples else None,
+            "p99_ms":round(percentile(samples,0.99),2) if samples else None}
+
+
+async def drive(baseUrl,uploads,concurrency,timeout):
+    results=[]
+    pending=iter(uploads)
+    userId=str(uuid.uuid4())
+
+    async def worker(client):
+        for item in pending:
+            data=item["data"]
+            form={"page_num":"1","range":"0","user_req":"summarize","user_id":userId}
+            files={"file":(f"{item['size']}.{item['type']}",data)}
+            started=time.perf_counter()
+            try:
+                response=await client.post(f"{baseUrl}/summary",data=form,files=files)
+                body=response.json()
+                ok=response.status_code==200 and body.get("status code")==200 and isinstance(body.get("data"),str)
+            except Exception:
+                ok=False
+            results.append({"type":item["type"],"size":item["size"],"bytes":len(data),
+                            "ms":(time.perf_counter()-started)*1000,"ok":ok})
+
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        started=time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed=time.perf_counter()-started
+        peak=(await client.get(f"{baseUrl}/uploadStats")).json()["data"]["process_peak_rss_bytes"]
+    return results,elapsed,peak
+
+
+def summarize(results,elapsed,peakRss):
+    okMs=[r["ms"] for r in results if r["ok"]]
+    report={"requests":len(results),
+            "errors":sum(1 for r in results if not r["ok"]),
+            "elapsed_s":round(elapsed,3),
+            "rps":round(len(okMs)/elapsed,3) if elapsed else None,
+            "latency":latencySummary(okMs),
+            "server_peak_rss_bytes":peakRss,
+            "by_type":{},
+            "by_size":{}}
+    for fileType in fileTypes:
+        report["by_type"][fileType]=latencySummary([r["ms"] for r in results if r["ok"] and r["type"]==fileType])
+    for size in sizes:
+        report["by_size"][size]=latencySummary([r["ms"] for r in results if r["ok"] and r["size"]==size])
+    return report
+
+
+def compare(current,baseline,tolerance):
+    """Prints the change against a previous result; returns the regressions."""
+    regressions=[]
+    rows=[("rps",current["rps"],baseline["rps"],True),
+          ("p50_ms",current["latency"]["p50_ms"],baseline["latency"]["p50_ms"],False),
+          ("p95_ms",current["latency"]["p95_ms"],baseline["latency"]["p95_ms"],False),
+          ("p99_ms",current["latency"]["p99_ms"],baseline["latency"]["p99_ms"],False),
+          ("peak_rss_mb",current["server_peak_rss_bytes"]/2**20,baseline["server_peak_rss_bytes"]/2**20,False)]
+    print(f"\n{'metric':<14}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name,now,before,higherIsBetter in rows:
+        if now is None or not before:
+            continue
+        change=(now-before)/before
+        worse=change<-tolerance if higherIsBetter else change>tolerance
+        flag="  REGRESSION" if worse else ""
+        print(f"{name:<14}{before:>12.2f}{now:>12.2f}{change:>+10.1%}{flag}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def gitCommit():
+    try:
+        return subprocess.run(["git","rev-parse","--short","HEAD"],cwd=appDir,capture_output=True,text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def waitForServer(baseUrl,process,timeout=60):
+    deadline=time.time()+timeout
+    while time.time()<deadline:
+        if process.poll() is not None:
+            raise RuntimeError("app server exited during startup")
+        try:
+            if httpx.get(f"{baseUrl}/",timeout=1).status_code==200:
+                return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError("app server did not start")
+
+
+def main():
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--concurrency",type=int,default=8)
+    parser.add_argument("--requests",type=int,default=100)
+    parser.add_argument("--latency",type=float,default=0.2,help="fake Ollama time to first token, seconds")
+    parser.add_argument("--tokens-per-second",type=float,default=200)
+    parser.add_argument("--completion-tokens",type=int,default=80)
+    parser.add_argument("--cached",action="store_true",help="reuse uploads so repeats hit the summary cache")
+    parser.add_argument("--postgres",action="store_true",help="write history to Postgres (DB_* settings)")
+    parser.add_argument("--timeout",type=float,default=300)
+    parser.add_argument("--seed",type=int,default=7)
+    parser.add_argument("--output",default=None,help="result file; defaults to benchmarks/results/load_<utc time>.json")
+    parser.add_argument("--baseline",default=None,help="earlier result file to compare against")
+    parser.add_argument("--tolerance",type=float,default=0.10,help="relative change reported as a regression")
+    parser.add_argument("--serve",type=int,default=None,help=argparse.SUPPRESS)
+    args=parser.parse_args()
+
+    if args.serve:
+        serve(args.serve,args.postgres)
+        return
+
+    ollamaPort=freePort()
+    ollama=startInThread(fakeOllamaApp(args.latency,args.tokens_per_second,args.completion_tokens),ollamaPort)
+
+    appPort=freePort()
+    workdir=tempfile.mkdtemp(prefix="load_bench_")
+    env=dict(os.environ,OLLAMA_BASE_URL=f"http://127.0.0.1:{ollamaPort}",LOG_LEVEL="WARNING",
+             JOB_STORE_PATH=os.path.join(workdir,"jobs.db"),JOB_SPOOL_DIR=os.path.join(workdir,"spool"),
+             VECTOR_INDEX_DIR=os.path.join(workdir,"vectors"))
+    command=[sys.executable,os.path.abspath(__file__),"--serve",str(appPort)]+(["--postgres"] if args.postgres else [])
+    server=subprocess.Popen(command,cwd=appDir,env=env)
+    baseUrl=f"http://127.0.0.1:{appPort}"
+    try:
+        waitForServer(baseUrl,server)
+        uploads=buildUploads(args.requests,not args.cached,args.seed)
+        results,elapsed,peak=asyncio.run(drive(baseUrl,uploads,args.concurrency,args.timeout))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        ollama.should_exit=True
+
+    report=summarize(results,elapsed,peak)
+    record={"benchmark":"summary_load",
+            "created_at":datetime.now(timezone.utc).isoformat(),
+            "commit":gitCommit(),
+            "settings":{"concurrency":args.concurrency,"requests":args.requests,"latency_s":args.latency,
+                        "tokens_per_second":args.tokens_per_second,"completion_tokens":args.completion_tokens,
+                        "cached":args.cached,"store":"postgres" if args.postgres else "memory",
+                        "max_concurrent_summaries":int(os.getenv('MAX_CONCURRENT_SUMMARIES',4))},
+            "results":report}
+
+    print(f"{'type':<8}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for fileType,stats in report["by_type"].items():
+        if stats["count"]:
+            print(f"{fileType:<8}{stats['count']:>7}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+    overall=report["latency"]
+    print(f"\nrequests {report['requests']}  errors {report['errors']}  rps {report['rps']}")
+    if overall["count"]:
+        print(f"p50 {overall['p50_ms']:.1f} ms  p95 {overall['p95_ms']:.1f} ms  p99 {overall['p99_ms']:.1f} ms")
+    print(f"server peak rss {report['server_peak_rss_bytes']/2**20:.1f} MiB")
+
+    output=args.output or os.path.join(benchDir,"results",f"load_{datetime.now(timezone.utc):%Y%m%dT%H%M%S}.json")
+    os.makedirs(os.path.dirname(output),exist_ok=True)
+    with open(output,"w") as target:
+        json.dump(record,target,indent=2)
+    print(f"results: {output}")
+
+    if args.baseline:
+        with open(args.baseline) as source:
+            baseline=json.load(source)
+        if compare(report,baseline["results"],args.tolerance):
+            sys.exit(1)
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Compares summary-to-PDF rendering paths.
+
+    docx:     legacyDocx, the docx file write the old PDF path started with
+    docx2pdf: legacyPdf on that file, the old conversion step
+    native:   convertSummaryToPdfBytes (fpdf, in memory)
+
+The legacy steps live here rather than in service, so the service has no
+render path that writes to the working directory.
+
+docx2pdf needs Microsoft Word; where it raises NotImplementedError (Linux)
+the docx2pdf row is skipped rather than timing a failed attempt.
+
+    python benchmarks/bench_pdf_render.py --iterations 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from service import buildSummaryDocx,convertSummaryToPdfBytes
+
+
+def sampleSummary(sections):
+    lines=["# Quarterly Vendor Contract Review"]
+    for i in range(1,sections+1):
+        lines.append(f"## Section {i}: Key Findings")
+        lines.append("### Overview")
+        for j in range(1,6):
+            lines.append(f"- **Point {j}:** The contract’s renewal terms – including pricing and service levels – were reviewed in detail for item {i}.{j}.")
+        lines.append("Plain paragraph text with a **bold phrase** in the middle that wraps over more than one line of the page width.")
+    return "\n".join(lines)
+
+
+def timeIt(func,iterations):
+    samples=[]
+    for _ in range(iterations):
+        started=time.perf_counter()
+        func()
+        samples.append((time.perf_counter()-started)*1000)
+    return samples
+
+
+def legacyDocx(summary,path="bench_summary.docx"):
+    buildSummaryDocx(summary).save(path)
+    return path
+
+
+def legacyPdf(docxPath):
+    # docx2pdf drives Microsoft Word, so it only works on Windows/macOS
+    from docx2pdf import convert
+    convert(docxPath)
+
+
+def docx2pdfSupported(docxPath):
+    try:
+        legacyPdf(docxPath)
+        return True
+    except (ImportError,NotImplementedError):
+        return False
+
+
+def report(name,sections,samples):
+    samples=sorted(samples)
+    p95=samples[min(len(samples)-1,int(len(samples)*0.95))]
+    print(f"{name:<10}{sections:>9}{statistics.mean(samples):>11.2f}{statistics.median(samples):>11.2f}{p95:>11.2f}")
+
+
+def main():
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--iterations",type=int,default=20)
+    parser.add_argument("--sections",type=int,nargs="+",default=[2,10,50])
+    args=parser.parse_args()
+
+    workdir=tempfile.mkdtemp(prefix="pdf_bench_")
+    os.chdir(workdir)
+    convert=docx2pdfSupported(legacyDocx(sampleSummary(1)))
+    if not convert:
+        print("docx2pdf unavailable here (needs Microsoft Word); skipping the docx2pdf row")
+
+    print(f"{'path':<10}{'sections':>9}{'mean ms':>11}{'p50 ms':>11}{'p95 ms':>11}")
+    for sections in args.sections:
+        summary=sampleSummary(sections)
+        report("docx",sections,timeIt(lambda: legacyDocx(summary),args.iterations))
+        if convert:
+            report("docx2pdf",sections,timeIt(lambda: legacyPdf("bench_summary.docx"),args.iterations))
+        report("native",sections,timeIt(lambda: convertSummaryToPdfBytes(summary),args.iterations))
+
+    with open("native_sample.pdf","wb") as sample:
+        sample.write(convertSummaryToPdfBytes(sampleSummary(2)))
+    print(f"sample output: {os.path.join(workdir,'native_sample.pdf')}")
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,68 @@
+import math
+import re
+import config
+
+paragraphBreak = re.compile(r'(\n\s*\n)')
+sentenceBreak = re.compile(r'(?<=[.!?])(\s+)')
+
+
+def countTokens(text):
+    # Llama tokenizers average roughly four characters per token on English
+    # prose; close enough for budgeting without loading a tokenizer
+    return math.ceil(len(text)/config.CHARS_PER_TOKEN)
+
+
+def splitPieces(text,maxChars):
+    """Breaks text into pieces of at most maxChars, preferring paragraph,
+    then sentence, then word boundaries."""
+    pieces=[]
+    for paragraph in paragraphBreak.split(text):
+        if len(paragraph)<=maxChars:
+            pieces.append(paragraph)
+            continue
+        for sentence in sentenceBreak.split(paragraph):
+            if len(sentence)<=maxChars:
+                pieces.append(sentence)
+                continue
+            start=0
+            while start<len(sentence):
+                end=min(start+maxChars,len(sentence))
+                if end<len(sentence):
+                    space=sentence.rfind(' ',start,end)
+                    if space>start:
+                        end=space+1
+                pieces.append(sentence[start:end])
+                start=end
+    return [piece for piece in pieces if piece]
+
+
+def splitByTokens(text,maxTokens=None,overlapTokens=None):
+    """Packs text into chunks of at most maxTokens, carrying roughly
+    overlapTokens of trailing context into the next chunk."""
+    maxTokens=maxTokens or config.CHUNK_TOKENS
+    overlapTokens=config.CHUNK_OVERLAP_TOKENS if overlapTokens is None else overlapTokens
+    maxChars=maxTokens*config.CHARS_PER_TOKEN
+    overlapChars=min(overlapTokens*config.CHARS_PER_TOKEN,maxChars//2)
+
+    chunks=[]
+    current=[]
+    size=0
+    for piece in splitPieces(text,maxChars):
+        if current and size+len(piece)>maxChars:
+            chunks.append(''.join(current))
+            tail=[]
+            tailSize=0
+            for previous in reversed(current):
+                if tailSize+len(previous)>overlapChars:
+                    break
+                tail.insert(0,previous)
+                tailSize+=len(previous)
+            if tailSize+len(piece)>maxChars:
+                tail,tailSize=[],0
+            current,size=tail,tailSize
+        current.append(piece)
+        size+=len(piece)
+
+    if current and ''.join(current).strip():
+        chunks.append(''.join(current))
+    return chunks
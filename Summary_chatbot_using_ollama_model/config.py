@@ -0,0 +1,126 @@
+import os
+
+# Postgres connection settings
+DB_HOST = os.getenv('DB_HOST', 'localhost')
+DB_NAME = os.getenv('DB_NAME', 'Summary_Db')
+DB_USER = os.getenv('DB_USER', 'postgres')
+DB_PASSWORD = os.getenv('DB_PASSWORD', 'Cyber9600')
+DB_PORT = int(os.getenv('DB_PORT', 5432))
+
+# Connection pool settings
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 10))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_POOL_HEALTHCHECK_INTERVAL = float(os.getenv('DB_POOL_HEALTHCHECK_INTERVAL', 30))
+
+# Summary pipeline concurrency
+MAX_CONCURRENT_SUMMARIES = int(os.getenv('MAX_CONCURRENT_SUMMARIES', 4))
+BLOCKING_WORKERS = int(os.getenv('BLOCKING_WORKERS', os.cpu_count() or 4))
+
+# Ollama model
+OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3.2:latest')
+OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL') or None
+OLLAMA_TEMPERATURE = float(os.getenv('OLLAMA_TEMPERATURE', 0.3))
+OLLAMA_NUM_CTX = int(os.getenv('OLLAMA_NUM_CTX', 0)) or None
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+OLLAMA_PRELOAD = os.getenv('OLLAMA_PRELOAD', 'true').lower()=='true'
+OLLAMA_WARMUP_TIMEOUT = float(os.getenv('OLLAMA_WARMUP_TIMEOUT', 120))
+
+# Summary cache
+SUMMARY_CACHE_SIZE = int(os.getenv('SUMMARY_CACHE_SIZE', 1024))
+
+# Chunked (map-reduce) summarization
+CHARS_PER_TOKEN = int(os.getenv('CHARS_PER_TOKEN', 4))
+CHUNKED_SUMMARY_THRESHOLD = int(os.getenv('CHUNKED_SUMMARY_THRESHOLD', 3000))
+CHUNK_TOKENS = int(os.getenv('CHUNK_TOKENS', 1500))
+CHUNK_OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', 100))
+MAP_CONCURRENCY = int(os.getenv('MAP_CONCURRENCY', 4))
+MAX_MAP_ROUNDS = int(os.getenv('MAX_MAP_ROUNDS', 3))
+
+# Context window budgeting; Ollama's own default applies when OLLAMA_NUM_CTX is unset
+CONTEXT_WINDOW_TOKENS = OLLAMA_NUM_CTX or int(os.getenv('CONTEXT_WINDOW_TOKENS', 4096))
+COMPLETION_RESERVE_TOKENS = int(os.getenv('COMPLETION_RESERVE_TOKENS', 1024))
+BUDGET_TRIM_TOKENS = int(os.getenv('BUDGET_TRIM_TOKENS', 256))
+
+# PDF extraction
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', 200))
+PDF_PROCESS_WORKERS = int(os.getenv('PDF_PROCESS_WORKERS', min(os.cpu_count() or 1,4)))
+
+# Background summary jobs
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_QUEUE_MAXSIZE = int(os.getenv('JOB_QUEUE_MAXSIZE', 100))
+JOB_STORE_PATH = os.getenv('JOB_STORE_PATH', 'summary_jobs.db')
+JOB_SPOOL_DIR = os.getenv('JOB_SPOOL_DIR', 'summary_jobs_spool')
+
+# Rendered docx/pdf cache
+ARTIFACT_CACHE_BYTES = int(os.getenv('ARTIFACT_CACHE_BYTES', 64*1024*1024))
+ARTIFACT_CACHE_TTL = float(os.getenv('ARTIFACT_CACHE_TTL', 3600))
+ARTIFACT_SPILL_DIR = os.getenv('ARTIFACT_SPILL_DIR') or None
+ARTIFACT_SPILL_BYTES = int(os.getenv('ARTIFACT_SPILL_BYTES', 512*1024*1024))
+# TrueType fonts for summaries outside latin-1; point these at a Noto CJK
+# font for CJK text. Without them such summaries download as docx.
+PDF_FONT_PATH = os.getenv('PDF_FONT_PATH', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+PDF_BOLD_FONT_PATH = os.getenv('PDF_BOLD_FONT_PATH', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf')
+
+# Write-behind history inserts; rows are flushed by count or after the interval
+HISTORY_WRITE_BEHIND = os.getenv('HISTORY_WRITE_BEHIND', 'true').lower()=='true'
+HISTORY_BATCH_SIZE = int(os.getenv('HISTORY_BATCH_SIZE', 200))
+HISTORY_FLUSH_INTERVAL = float(os.getenv('HISTORY_FLUSH_INTERVAL', 0.5))
+HISTORY_QUEUE_MAXSIZE = int(os.getenv('HISTORY_QUEUE_MAXSIZE', 10000))
+
+# Content blobs: extracted text is stored compressed (zstd, or zlib without zstandard)
+CONTENT_ZSTD_LEVEL = int(os.getenv('CONTENT_ZSTD_LEVEL', 6))
+CONTENT_ZLIB_LEVEL = int(os.getenv('CONTENT_ZLIB_LEVEL', 6))
+CONTENT_MIGRATION_BATCH = int(os.getenv('CONTENT_MIGRATION_BATCH', 500))
+
+# Full-text search; the language is baked into the search_vector columns
+SEARCH_LANGUAGE = os.getenv('SEARCH_LANGUAGE', 'english')
+SEARCH_CONTENT_CHARS = int(os.getenv('SEARCH_CONTENT_CHARS', 100000))
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', 20))
+
+# Semantic search: per-user float16 vector index of summaries and content chunks
+VECTOR_INDEX_ENABLED = os.getenv('VECTOR_INDEX_ENABLED', 'true').lower()=='true'
+VECTOR_INDEX_DIR = os.getenv('VECTOR_INDEX_DIR', 'vector_index')
+VECTOR_QUEUE_MAXSIZE = int(os.getenv('VECTOR_QUEUE_MAXSIZE', 10000))
+VECTOR_OPEN_USERS = int(os.getenv('VECTOR_OPEN_USERS', 256))
+VECTOR_SEARCH_BLOCK_ROWS = int(os.getenv('VECTOR_SEARCH_BLOCK_ROWS', 16384))
+VECTOR_TOP_K = int(os.getenv('VECTOR_TOP_K', 10))
+EMBED_MODEL = os.getenv('EMBED_MODEL', 'nomic-embed-text')
+EMBED_BATCH_SIZE = int(os.getenv('EMBED_BATCH_SIZE', 64))
+EMBED_CHUNK_TOKENS = int(os.getenv('EMBED_CHUNK_TOKENS', 512))
+EMBED_CHUNK_OVERLAP_TOKENS = int(os.getenv('EMBED_CHUNK_OVERLAP_TOKENS', 64))
+EMBED_MAX_CHUNKS = int(os.getenv('EMBED_MAX_CHUNKS', 200))
+EMBED_CACHE_SIZE = int(os.getenv('EMBED_CACHE_SIZE', 4096))
+
+# History pagination
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', 20))
+HISTORY_PAGE_MAX = int(os.getenv('HISTORY_PAGE_MAX', 100))
+
+# CSV/XLSX ingestion: 'profile' sends a compact table profile, 'raw' the full DataFrame.to_string()
+TABULAR_MODE = os.getenv('TABULAR_MODE', 'profile')
+TABULAR_CHUNK_ROWS = int(os.getenv('TABULAR_CHUNK_ROWS', 50000))
+TABULAR_SAMPLE_ROWS = int(os.getenv('TABULAR_SAMPLE_ROWS', 50))
+TABULAR_TOP_K = int(os.getenv('TABULAR_TOP_K', 5))
+TABULAR_MAX_PROMPT_CHARS = int(os.getenv('TABULAR_MAX_PROMPT_CHARS', 12000))
+
+# Uploads
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', 100*1024*1024))
+UPLOAD_SPOOL_THRESHOLD = int(os.getenv('UPLOAD_SPOOL_THRESHOLD', 4*1024*1024))
+UPLOAD_SPOOL_DIR = os.getenv('UPLOAD_SPOOL_DIR') or None
+UPLOAD_FORM_OVERHEAD_BYTES = int(os.getenv('UPLOAD_FORM_OVERHEAD_BYTES', 64*1024))
+
+# Sessions
+SESSION_TTL = int(os.getenv('SESSION_TTL', 24*3600))
+SESSION_CACHE_SIZE = int(os.getenv('SESSION_CACHE_SIZE', 10000))
+SESSION_CACHE_TTL = int(os.getenv('SESSION_CACHE_TTL', 300))
+# When false, requests without an Authorization header still work with a bare user_id
+REQUIRE_SESSION = os.getenv('REQUIRE_SESSION', 'false').lower()=='true'
+
+# Batch summaries
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 4))
+BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', 100))
+BATCH_MAX_BYTES = int(os.getenv('BATCH_MAX_BYTES', 500*1024*1024))
+
+# Logging and metrics; LOG_LEVEL=WARNING silences the per-request debug/info lines
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower()=='true'
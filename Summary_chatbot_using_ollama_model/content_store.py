@@ -0,0 +1,122 @@
+import hashlib
+import logging
+import zlib
+import config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# the plain text is only sent along to build the full-text search vector
+upsertBlobQuery = f"""Insert into contentBlob(content_hash,codec,raw_size,data,search_vector)
+                      Select v.content_hash,v.codec,v.raw_size,v.data,to_tsvector('{config.SEARCH_LANGUAGE}',v.body)
+                      from (values %s) as v(content_hash,codec,raw_size,data,body)
+                      on conflict (content_hash) do nothing"""
+
+
+def contentHash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def compressContent(text):
+    """(codec, bytes) for the extracted text; zstd when available, else zlib."""
+    raw = text.encode('utf-8')
+    if zstandard is not None:
+        return 'zstd',zstandard.ZstdCompressor(level=config.CONTENT_ZSTD_LEVEL).compress(raw)
+    return 'zlib',zlib.compress(raw,config.CONTENT_ZLIB_LEVEL)
+
+
+def decompressContent(codec,data):
+    if data is None:
+        return None
+    data = bytes(data)
+    if codec=='zstd':
+        if zstandard is None:
+            raise RuntimeError("content is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+    if codec=='zlib':
+        return zlib.decompress(data).decode('utf-8')
+    return data.decode('utf-8')
+
+
+def storedContent(content,codec,data):
+    # rows written before the blob table still carry their text inline
+    return content if content is not None else decompressContent(codec,data)
+
+
+def packContent(rows,contentIndex=1):
+    """Moves the text out of history rows into blobs.
+
+    Returns (rows, blobs): each row has its content replaced by None and
+    its sha256 appended; blobs holds one (hash, codec, raw size, data,
+    searchable prefix) per distinct text, ready for upsertBlobQuery.
+    """
+    packed = []
+    blobs = {}
+    for row in rows:
+        text = row[contentIndex]
+        digest = None
+        if text is not None:
+            digest = contentHash(text)
+            if digest not in blobs:
+                codec,data = compressContent(text)
+                body = text[:config.SEARCH_CONTENT_CHARS] if config.SEARCH_CONTENT_CHARS else None
+                blobs[digest] = (digest,codec,len(text.encode('utf-8')),data,body)
+        packed.append(row[:contentIndex]+(None,)+row[contentIndex+1:]+(digest,))
+    return packed,list(blobs.values())
+
+
+def compressStoredBlobs(pg,batchSize=None):
+    """Recompresses blobs the SQL migration copied in uncompressed
+    (codec 'none'), one committed batch at a time. Safe to re-run."""
+    batchSize = batchSize or config.CONTENT_MIGRATION_BATCH
+    total = 0
+    while True:
+        rows = pg.showData("Select content_hash,data from contentBlob where codec='none' limit %s",(batchSize,))
+        if not isinstance(rows,list) or not rows:
+            break
+        updates = []
+        for digest,data in rows:
+            codec,compressed = compressContent(bytes(data).decode('utf-8'))
+            updates.append((digest,codec,compressed))
+        result = pg.insertBatch([("""Update contentBlob set codec=v.codec,data=v.data
+                                     from (values %s) as v(content_hash,codec,data)
+                                     where contentBlob.content_hash=v.content_hash""",updates)])
+        if result.get('error'):
+            logger.error("Content blob compression failed: %s",result['error'])
+            break
+        total += len(rows)
+    if total:
+        logger.info("Compressed %d stored content blobs",total)
+    return total
+
+
+def indexStoredBlobs(pg,batchSize=None):
+    """Fills search_vector for blobs stored before full-text search, one
+    committed batch at a time, decompressing each in Python. Safe to re-run."""
+    if not config.SEARCH_CONTENT_CHARS:
+        return 0
+    batchSize = batchSize or config.CONTENT_MIGRATION_BATCH
+    total = 0
+    lastHash = ''
+    while True:
+        rows = pg.showData("""Select content_hash,codec,data from contentBlob
+                              where search_vector is null and content_hash>%s
+                              order by content_hash limit %s""",(lastHash,batchSize))
+        if not isinstance(rows,list) or not rows:
+            break
+        updates = [(digest,decompressContent(codec,data)[:config.SEARCH_CONTENT_CHARS]) for digest,codec,data in rows]
+        result = pg.insertBatch([(f"""Update contentBlob set search_vector=to_tsvector('{config.SEARCH_LANGUAGE}',v.body)
+                                      from (values %s) as v(content_hash,body)
+                                      where contentBlob.content_hash=v.content_hash""",updates)])
+        if result.get('error'):
+            logger.error("Content blob indexing failed: %s",result['error'])
+            break
+        total += len(rows)
+        lastHash = rows[-1][0]
+    if total:
+        logger.info("Indexed %d stored content blobs for search",total)
+    return total
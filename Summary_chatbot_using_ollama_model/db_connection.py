@@ -1,14 +1,142 @@
+import asyncio
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
 import psycopg2 as pg
+from psycopg2 import pool as pgPool
+from psycopg2.extras import execute_values
+import config
+
+
+# COPY text format: tab separated, \N for NULL, backslash escapes
+copyEscapes = str.maketrans({'\\':'\\\\','\t':'\\t','\n':'\\n','\r':'\\r'})
+
+def copyLine(values):
+    return '\t'.join('\\N' if value is None else str(value).translate(copyEscapes) for value in values)+'\n'
+
+
+class connectionPool:
+    """Process-wide psycopg2 pool with blocking checkout and health checks."""
+
+    def __init__(self,minconn=config.DB_POOL_MIN,maxconn=config.DB_POOL_MAX,timeout=config.DB_POOL_TIMEOUT):
+        self.pool = pgPool.ThreadedConnectionPool(minconn,maxconn,
+                                                  host=config.DB_HOST,dbname=config.DB_NAME,user=config.DB_USER,
+                                                  password=config.DB_PASSWORD,port=config.DB_PORT)
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(maxconn)
+        self.lastUsed = {}
+        self.inUse = 0
+        self.lock = threading.Lock()
+
+    def getconn(self):
+        # ThreadedConnectionPool raises instead of waiting when exhausted,
+        # so callers queue on the semaphore first
+        if not self.slots.acquire(timeout=self.timeout):
+            raise pgPool.PoolError(f"no free database connection after {self.timeout}s")
+        try:
+            conn = self.pool.getconn()
+            if not self.isHealthy(conn):
+                self.pool.putconn(conn,close=True)
+                conn = self.pool.getconn()
+        except Exception:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.inUse += 1
+        return conn
+
+    def putconn(self,conn):
+        close = bool(conn.closed)
+        if not close and conn.get_transaction_status() != pg.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except Exception:
+                close = True
+        self.lastUsed[id(conn)] = time.monotonic()
+        try:
+            self.pool.putconn(conn,close=close)
+        finally:
+            with self.lock:
+                self.inUse -= 1
+            self.slots.release()
+
+    def isHealthy(self,conn):
+        if conn.closed:
+            return False
+        idle = time.monotonic() - self.lastUsed.get(id(conn),0)
+        if idle < config.DB_POOL_HEALTHCHECK_INTERVAL:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def stats(self):
+        with self.lock:
+            return {"min":self.minconn,"max":self.maxconn,"in_use":self.inUse,"idle":len(self.pool._pool)}
+
+    def closeall(self):
+        self.pool.closeall()
+
+
+_pool = None
+_poolLock = threading.Lock()
+
+def getPool():
+    global _pool
+    if _pool is None:
+        with _poolLock:
+            if _pool is None:
+                _pool = connectionPool()
+    return _pool
+
+def poolStats():
+    # None until the first connection is checked out; never opens the pool
+    pool = _pool
+    return pool.stats() if pool is not None else None
+
+def closePool():
+    global _pool
+    with _poolLock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
 
 class postgresDb:
+    """Checks a connection out of the shared pool; disconnect() hands it back.
+
+    Can be used as a context manager:
+
+        with postgresDb() as pg:
+            pg.showData(query,values)
+    """
+
     def __init__(self):
-        self.conn = pg.connect(host='localhost',dbname='Summary_Db',user='postgres',password='Cyber9600',port=5432)
+        self.pool = getPool()
+        self.conn = self.pool.getconn()
         self.cur = self.conn.cursor()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc,tb):
+        self.disconnect()
 
     def disconnect(self):
-        self.cur.close()
-        self.conn.close()
+        if self.conn is None:
+            return
+        if not self.cur.closed:
+            self.cur.close()
+        self.pool.putconn(self.conn)
+        self.conn = None
 
     def showData(self,query,val=None):
         try:
@@ -44,9 +172,34 @@ class postgresDb:
             self.conn.rollback()
             return {"data":'insert data not successfully','error':e}
 
-    def deleteData(self,query):
+    def insertBatch(self,statements,copy=None,before=()):
+        """Runs (query, rows) pairs through execute_values in one transaction.
+        Each query has a single `values %s` placeholder for its rows.
+        copy=(table, columns, rows) is streamed in with COPY first, after
+        any `before` statements."""
         try:
-            self.cur.execute(query)
+            for query,rows in before:
+                if rows:
+                    execute_values(self.cur,query,rows)
+            if copy and copy[2]:
+                table,columns,rows = copy
+                buffer = StringIO(''.join(copyLine(row) for row in rows))
+                self.cur.copy_expert(f"COPY {table}({','.join(columns)}) FROM STDIN",buffer)
+            for query,rows in statements:
+                execute_values(self.cur,query,rows)
+            self.conn.commit()
+            return {"data":'insert data successfully',"status code":200}
+
+        except Exception as e:
+            self.conn.rollback()
+            return {"data":'insert data not successfully','error':e}
+
+    def deleteData(self,query,val=None):
+        try:
+            if val:
+                self.cur.execute(query,val)
+            else:
+                self.cur.execute(query)
             self.conn.commit()
             return {"data":'delete data successfully',"status code":200}
             
@@ -66,6 +219,88 @@ class postgresDb:
             return {"data":'update data not successfully','error':e}
 
 
+# Async callers wait for a pool slot on the event loop, so at most
+# DB_POOL_MAX of them hold a thread from dbExecutor at any time: a
+# connection holder can always get a thread to run its query or hand the
+# connection back, however many requests are queued behind it.
+dbExecutor = ThreadPoolExecutor(max_workers=config.DB_POOL_MAX,thread_name_prefix='db')
+asyncSlots = weakref.WeakKeyDictionary()
+
+def loopSlots():
+    loop = asyncio.get_running_loop()
+    slots = asyncSlots.get(loop)
+    if slots is None:
+        slots = asyncSlots[loop] = asyncio.Semaphore(config.DB_POOL_MAX)
+    return slots
+
+async def runDb(func,*args):
+    return await asyncio.get_running_loop().run_in_executor(dbExecutor,func,*args)
+
+
+class asyncPostgresDb:
+    """Awaitable wrapper around postgresDb for FastAPI handlers.
+
+    Checkout and every query run on dbExecutor so the event loop is never
+    blocked on the socket; waiting for a free connection happens on the
+    loop itself.
+
+        async with asyncPostgresDb() as pg:
+            rows = await pg.showData(query,values)
+    """
+
+    def __init__(self):
+        self.db = None
+        self.slots = None
+
+    async def __aenter__(self):
+        slots = loopSlots()
+        try:
+            await asyncio.wait_for(slots.acquire(),config.DB_POOL_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise pgPool.PoolError(f"no free database connection after {config.DB_POOL_TIMEOUT}s")
+        checkout = asyncio.get_running_loop().run_in_executor(dbExecutor,postgresDb)
+        try:
+            self.db = await asyncio.shield(checkout)
+        except asyncio.CancelledError:
+            # the checkout still finishes in its thread; hand it straight back
+            checkout.add_done_callback(lambda done: done.cancelled() or done.exception() or dbExecutor.submit(done.result().disconnect))
+            slots.release()
+            raise
+        except BaseException:
+            slots.release()
+            raise
+        self.slots = slots
+        return self
+
+    async def __aexit__(self,exc_type,exc,tb):
+        await self.disconnect()
+
+    async def disconnect(self):
+        if self.db is not None:
+            try:
+                await asyncio.shield(runDb(self.db.disconnect))
+            finally:
+                self.db = None
+                self.slots.release()
+
+    async def showData(self,query,val=None):
+        return await runDb(self.db.showData,query,val)
+
+    async def create(self,query):
+        return await runDb(self.db.create,query)
+
+    async def insertData(self,query,val=None):
+        return await runDb(self.db.insertData,query,val)
+
+    async def insertBatch(self,statements,copy=None,before=()):
+        return await runDb(self.db.insertBatch,statements,copy,before)
+
+    async def deleteData(self,query,val=None):
+        return await runDb(self.db.deleteData,query,val)
+
+    async def updateData(self,query):
+        return await runDb(self.db.updateData,query)
+
 
 # pg=postgresDb()
 
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import time
+from db_connection import asyncPostgresDb
+from content_store import packContent,upsertBlobQuery
+from metrics import metricsRegistry
+from summary_cache import summaryCacheStore
+from vector_index import vectorIndex,historyItems
+import config
+
+logger = logging.getLogger(__name__)
+
+# service.summaryRow order plus the content_hash packContent appends
+historyColumns = ('fileType','content','llmSummary','user_id','cache_key','summary_id','prompt_tokens','completion_tokens','content_hash')
+
+# cache hits copy the stored summary of another row with the same cache_key;
+# no model call was made, so no tokens are billed
+copyCachedQuery = """Insert into summaryHistory(fileType,content,llmSummary,user_id,cache_key,summary_id,prompt_tokens,completion_tokens,content_hash)
+                     Select h.fileType,h.content,h.llmSummary,v.user_id::uuid,h.cache_key,v.summary_id::uuid,0,0,h.content_hash
+                     from (values %s) as v(user_id,summary_id,cache_key)
+                     cross join lateral (Select fileType,content,llmSummary,cache_key,content_hash from summaryHistory
+                                         where cache_key=v.cache_key limit 1) h"""
+
+
+class summaryHistoryWriter:
+    """Write-behind buffer for summaryHistory rows.
+
+    write() and copy() queue a row and return without touching Postgres;
+    one flusher task writes queued rows in a single transaction (content
+    blobs, COPY for new summaries, then one multi-row insert for cache-hit
+    copies) once HISTORY_BATCH_SIZE rows are waiting or
+    HISTORY_FLUSH_INTERVAL seconds after the first one. A batch that fails
+    is retried one row at a time. Pass wait=True to get the flush result
+    once the row is committed. stop() flushes whatever is left. Committed summaries
+    go into the summary cache and the vector index only then, so a cache
+    hit never points at a row that failed to land.
+
+    With HISTORY_WRITE_BEHIND off, or before start(), every call writes
+    straight through.
+    """
+
+    def __init__(self,batchSize=None,flushInterval=None,maxsize=None):
+        self.batchSize=batchSize or config.HISTORY_BATCH_SIZE
+        self.flushInterval=config.HISTORY_FLUSH_INTERVAL if flushInterval is None else flushInterval
+        self.maxsize=maxsize or config.HISTORY_QUEUE_MAXSIZE
+        self.queue=None
+        self.task=None
+        self.metrics={"queued":0,"written":0,"batches":0,"failed":0,
+                      "last_batch_rows":0,"last_flush_ms":None}
+
+    async def start(self):
+        if not config.HISTORY_WRITE_BEHIND or self.task is not None:
+            return
+        self.queue=asyncio.Queue(maxsize=self.maxsize)
+        self.task=asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is None:
+            return
+        await self.queue.put(None)
+        await self.task
+        self.task=None
+        self.queue=None
+
+    async def write(self,row,wait=False):
+        """Queues one summaryRow tuple."""
+        return await self.submit('insert',row,wait)
+
+    async def copy(self,userId,summaryId,cacheKey,wait=False):
+        """Queues a history row copied from the cached summary for cacheKey."""
+        return await self.submit('copy',(str(userId),str(summaryId),cacheKey),wait)
+
+    async def writeBatch(self,rows,copies):
+        """Writes rows and copies now, in one transaction, bypassing the queue."""
+        return await self.flush([('insert',row,None) for row in rows]+[('copy',row,None) for row in copies])
+
+    async def submit(self,kind,row,wait):
+        if self.queue is None:
+            return await self.flush([(kind,row,None)])
+        future=asyncio.get_running_loop().create_future() if wait else None
+        # a full queue makes callers wait here rather than grow without bound
+        await self.queue.put((kind,row,future))
+        self.metrics["queued"]+=1
+        if future is not None:
+            return await future
+        return {"data":'queued',"status code":202}
+
+    async def run(self):
+        loop=asyncio.get_running_loop()
+        stopping=False
+        while not stopping:
+            item=await self.queue.get()
+            if item is None:
+                break
+            batch=[item]
+            deadline=loop.time()+self.flushInterval
+            while len(batch)<self.batchSize:
+                if self.queue.empty():
+                    timeout=deadline-loop.time()
+                    if timeout<=0:
+                        break
+                    try:
+                        item=await asyncio.wait_for(self.queue.get(),timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item=self.queue.get_nowait()
+                if item is None:
+                    stopping=True
+                    break
+                batch.append(item)
+            await self.flush(batch)
+
+        # writes that raced with stop()
+        leftovers=[]
+        while not self.queue.empty():
+            item=self.queue.get_nowait()
+            if item is not None:
+                leftovers.append(item)
+        if leftovers:
+            await self.flush(leftovers)
+
+    async def flush(self,batch):
+        rows=[row for kind,row,_ in batch if kind=='insert']
+        copies=[row for kind,row,_ in batch if kind=='copy']
+        statements=[(copyCachedQuery,copies)] if copies else []
+        started=time.perf_counter()
+        try:
+            packed,blobs=await asyncio.to_thread(packContent,rows)
+            with metricsRegistry.span('db_insert'):
+                async with asyncPostgresDb() as pg:
+                    result=await pg.insertBatch(statements,('summaryHistory',historyColumns,packed),[(upsertBlobQuery,blobs)])
+        except Exception as e:
+            result={"data":'insert data not successfully','error':e}
+
+        if result.get('error') and len(batch)>1:
+            # one bad row aborts the whole transaction; retry each row on
+            # its own so only that row is lost
+            logger.warning("History flush of %d rows failed, retrying row by row: %s",len(batch),result['error'])
+            results=[await self.flush([item]) for item in batch]
+            return next((single for single in results if single.get('error')),results[0])
+
+        self.metrics["last_flush_ms"]=round((time.perf_counter()-started)*1000,2)
+        self.metrics["last_batch_rows"]=len(batch)
+        self.metrics["batches"]+=1
+        if result.get('error'):
+            self.metrics["failed"]+=len(batch)
+            logger.error("History flush of %d rows failed: %s",len(batch),result['error'])
+        else:
+            self.metrics["written"]+=len(batch)
+            for row in rows:
+                # summaryRow order: cache_key is [4], the summary [2]
+                if row[4] and isinstance(row[2],str):
+                    summaryCacheStore.put(row[4],row[2])
+            vectorIndex.add(historyItems(rows,copies))
+
+        for _,_,future in batch:
+            if future is not None and not future.done():
+                future.set_result(result)
+        return result
+
+    def stats(self):
+        return {"enabled":self.task is not None,
+                "queue_depth":self.queue.qsize() if self.queue else 0,
+                "batch_size":self.batchSize,
+                "flush_interval":self.flushInterval,
+                **self.metrics}
+
+
+historyWriter = summaryHistoryWriter()
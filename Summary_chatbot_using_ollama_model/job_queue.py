@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import config
+from service import asyncSummaryService,asyncStoredSummary
+from uploads import spooledUpload
+
+logger = logging.getLogger(__name__)
+
+
+class jobStore:
+    """SQLite-backed job table so queued work survives a restart.
+
+    Upload bodies live as files in JOB_SPOOL_DIR; the table keeps their path.
+    """
+
+    def __init__(self,path=config.JOB_STORE_PATH):
+        self.conn = sqlite3.connect(path,check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("""
+                Create Table if not exists summaryJobs(
+                job_id text PRIMARY KEY,
+                state text,
+                file_type text,
+                user_id text,
+                page_num integer,
+                page_range integer,
+                payload_path text,
+                result text,
+                error text,
+                created_at real,
+                started_at real,
+                finished_at real)
+            """)
+            self.conn.commit()
+
+    def execute(self,query,values=()):
+        with self.lock:
+            cur = self.conn.execute(query,values)
+            rows = cur.fetchall()
+            self.conn.commit()
+            return rows
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class summaryJobQueue:
+    """Runs /summary work in background workers and tracks job state.
+
+    States: queued -> running -> done | failed. Jobs still queued or
+    running when the process stops are picked up again on start(); one
+    that had already started is first checked for a committed history
+    row, so a crash after the commit does not run it twice.
+    """
+
+    def __init__(self,workers=config.JOB_WORKERS,maxDepth=config.JOB_QUEUE_MAXSIZE):
+        self.workers = workers
+        self.maxDepth = maxDepth
+        self.store = None
+        self.queue = None
+        self.tasks = []
+        self.busy = 0
+        self.metrics = {"submitted":0,"completed":0,"failed":0,"rejected":0,
+                        "wait_seconds_total":0.0,"wait_seconds_max":0.0,
+                        "run_seconds_total":0.0,"run_seconds_max":0.0}
+
+    async def start(self):
+        os.makedirs(config.JOB_SPOOL_DIR,exist_ok=True)
+        self.store = await asyncio.to_thread(jobStore)
+        self.queue = asyncio.Queue()
+        pending = await asyncio.to_thread(self.store.execute,
+            "Select job_id from summaryJobs where state in ('queued','running') order by created_at")
+        await asyncio.to_thread(self.store.execute,
+            "Update summaryJobs set state='queued' where state='running'")
+        for (jobId,) in pending:
+            self.queue.put_nowait(jobId)
+        self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks,return_exceptions=True)
+        self.tasks = []
+        if self.store is not None:
+            await asyncio.to_thread(self.store.close)
+            self.store = None
+
+    async def submit(self,upload,file_type,user_id,page_num=None,page_range=None):
+        """Takes ownership of the spooledUpload; returns None when the queue is full."""
+        if self.queue.qsize()>=self.maxDepth:
+            self.metrics["rejected"]+=1
+            return None
+
+        jobId = str(uuid.uuid4())
+        payloadPath = os.path.join(config.JOB_SPOOL_DIR,jobId)
+        await asyncio.to_thread(upload.moveTo,payloadPath)
+        await asyncio.to_thread(self.store.execute,
+            """Insert into summaryJobs(job_id,state,file_type,user_id,page_num,page_range,payload_path,created_at)
+               values(?,?,?,?,?,?,?,?)""",
+            (jobId,'queued',file_type,str(user_id),page_num,page_range,payloadPath,time.time()))
+        self.queue.put_nowait(jobId)
+        self.metrics["submitted"]+=1
+        return jobId
+
+    async def status(self,jobId):
+        rows = await asyncio.to_thread(self.store.execute,
+            """Select state,file_type,user_id,result,error,created_at,started_at,finished_at
+               from summaryJobs where job_id=?""",(jobId,))
+        if not rows:
+            return None
+        state,fileType,userId,result,error,created,started,finished = rows[0]
+        return {"job_id":jobId,"state":state,"file_type":fileType,"user_id":userId,
+                "summary_id":jobId if state=='done' else None,
+                "result":result,"error":error,
+                "created_at":created,"started_at":started,"finished_at":finished}
+
+    async def worker(self):
+        while True:
+            jobId = await self.queue.get()
+            try:
+                await self.run(jobId)
+            except Exception:
+                logger.exception("Summary job %s failed",jobId)
+            finally:
+                self.queue.task_done()
+
+    async def run(self,jobId):
+        rows = await asyncio.to_thread(self.store.execute,
+            "Select file_type,user_id,page_num,page_range,payload_path,created_at,started_at from summaryJobs where job_id=? and state='queued'",
+            (jobId,))
+        if not rows:
+            return
+        fileType,userId,pageNum,pageRange,payloadPath,created,startedBefore = rows[0]
+
+        started = time.time()
+        await asyncio.to_thread(self.store.execute,
+            "Update summaryJobs set state='running',started_at=? where job_id=?",(started,jobId))
+        self.record("wait",started-created)
+
+        self.busy += 1
+        upload = None
+        try:
+            # the job id doubles as the summary id for downloads, and the
+            # history row is unique on it: a job that crashed after its
+            # commit is finished from that row instead of run again
+            result = await asyncStoredSummary(jobId,userId) if startedBefore else None
+            if result is None:
+                upload = await asyncio.to_thread(spooledUpload.fromPath,payloadPath)
+                # the job only reports done once its history row is committed
+                result = await asyncSummaryService(upload,fileType,uuid.UUID(userId),pageNum,pageRange,uuid.UUID(jobId),durable=True)
+            else:
+                upload = spooledUpload(path=payloadPath)
+        except Exception as e:
+            result = {"error":e}
+        finally:
+            self.busy -= 1
+            if upload is not None:
+                upload.close()
+
+        finished = time.time()
+        self.record("run",finished-started)
+        if isinstance(result,str):
+            self.metrics["completed"]+=1
+            await asyncio.to_thread(self.store.execute,
+                "Update summaryJobs set state='done',result=?,payload_path=null,finished_at=? where job_id=?",
+                (result,finished,jobId))
+        else:
+            self.metrics["failed"]+=1
+            error = result.get("error") if isinstance(result,dict) else result
+            await asyncio.to_thread(self.store.execute,
+                "Update summaryJobs set state='failed',error=?,payload_path=null,finished_at=? where job_id=?",
+                (str(error),finished,jobId))
+
+    def record(self,kind,seconds):
+        self.metrics[f"{kind}_seconds_total"]+=seconds
+        self.metrics[f"{kind}_seconds_max"]=max(self.metrics[f"{kind}_seconds_max"],seconds)
+
+    def stats(self):
+        return {"workers":self.workers,
+                "busy_workers":self.busy,
+                "queue_depth":self.queue.qsize() if self.queue else 0,
+                "max_queue_depth":self.maxDepth,
+                **self.metrics}
+
+
+summaryJobs = summaryJobQueue()
@@ -1,10 +1,113 @@
-from fastapi import FastAPI, UploadFile, File,HTTPException, Form
+from fastapi import FastAPI, UploadFile, File,HTTPException, Form, Request, Depends, Header
+from fastapi.responses import StreamingResponse,Response
 from pydantic import BaseModel
 import uvicorn
-from service import newUserService,loginService,summaryService,fetchHistoryService
-from uuid import UUID
+from contextlib import asynccontextmanager
+from service import newUserService,loginService,asyncSummaryService,asyncSummaryStream,asyncSummaryArtifact,artifactTypes,artifactFormat,asyncFetchHistoryService,asyncSearchHistoryService,asyncSemanticSearchService,asyncBatchSummaryService,blockingExecutor
+from db_connection import closePool,poolStats,dbExecutor
+from schema import applyMigrations
+from summary_cache import summaryCacheStore
+from job_queue import summaryJobs
+from artifact_cache import artifactStore
+from uploads import uploadFileType,spoolUpload,expandZip,uploadTooLarge,uploadStats,uploadSizeLimit,installUploadSpooling
+from model_registry import modelRegistry
+from session_cache import sessionStore
+from token_budget import tokenBudgeter
+from metrics import metricsRegistry
+from history_writer import historyWriter
+from pdf_pages import startPdfPagePool,stopPdfPagePool
+from vector_index import vectorIndex
+import asyncio
+import json
+import logging
+import time
+import zipfile
+from uuid import UUID,uuid4
+import config
 
-app=FastAPI()
+logging.basicConfig(level=config.LOG_LEVEL,format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(applyMigrations)
+    startPdfPagePool()
+    await modelRegistry.start()
+    await vectorIndex.start()
+    await historyWriter.start()
+    await summaryJobs.start()
+    yield
+    await summaryJobs.stop()
+    await historyWriter.stop()
+    await vectorIndex.stop()
+    await modelRegistry.stop()
+    artifactStore.clear()
+    blockingExecutor.shutdown(wait=False,cancel_futures=True)
+    stopPdfPagePool()
+    dbExecutor.shutdown(wait=True,cancel_futures=True)
+    closePool()
+
+app=FastAPI(lifespan=lifespan)
+# uploads are capped while they stream in and spooled once, by Starlette
+installUploadSpooling()
+app.add_middleware(uploadSizeLimit)
+
+
+@app.middleware("http")
+async def recordRequestMetrics(request: Request, call_next):
+    if not config.METRICS_ENABLED or request.url.path=='/metrics':
+        return await call_next(request)
+    started = time.perf_counter()
+    status = 500
+    metricsRegistry.requestsInFlight.inc()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metricsRegistry.requestsInFlight.dec()
+        # route template, so /jobs/{job_id} is one series rather than one per id
+        route = request.scope.get('route')
+        metricsRegistry.requestSeconds.observe(time.perf_counter()-started,request.method,
+                                               route.path if route else 'unmatched',status)
+
+
+async def sessionUser(authorization: str | None = Header(None)):
+    """User id of the bearer token, or None when no token was sent."""
+    if not authorization:
+        if config.REQUIRE_SESSION:
+            raise HTTPException(status_code=401,detail='Login required')
+        return None
+    scheme,_,token = authorization.partition(' ')
+    if scheme.lower()!='bearer' or not token:
+        raise HTTPException(status_code=401,detail='Authorization header should be "Bearer <token>"')
+    userId = await sessionStore.validate(token)
+    if userId is None:
+        raise HTTPException(status_code=401,detail='Session expired or invalid')
+    return userId
+
+
+def authorizeUser(user_id,session_user):
+    if session_user is not None and str(user_id)!=session_user:
+        raise HTTPException(status_code=403,detail='Token does not belong to this user')
+
+
+async def closeAfterStream(upload,events):
+    try:
+        async for event in events:
+            yield event
+    finally:
+        upload.close()
+
+
+async def closeBatchAfterStream(files,results):
+    try:
+        async for result in results:
+            yield json.dumps(result)+'\n'
+    finally:
+        for _,_,upload in files:
+            upload.close()
 
 
 class newUser(BaseModel):
@@ -30,7 +133,7 @@ async def createUser(user: newUser):
         if user.password!=user.confirmPassword:
             return {"data":"password and confirm password should be same",'status code':200}
         
-        newUser= newUserService(user)
+        newUser= await asyncio.to_thread(newUserService,user)
         return {"data":newUser.get('data'),'status code':200}
     except Exception as e:
         return {"error":e,'status code':400}
@@ -40,10 +143,26 @@ async def login(user :existUser):
      try:
          if user.email=='' and user.password=='':
             return HTTPException(status_code=400,detail='All fields should be non-empty')
-         login = loginService(user)
-         return {"data":login.get('data'),"status code":200}
+         login = await asyncio.to_thread(loginService,user)
+         if not isinstance(login,list):
+            return {"data":login,"status code":400}
+
+         userId,name,email = login[0]
+         token,expiresAt = await sessionStore.issue(userId)
+         return {"data":{"user_id":str(userId),"name":name,"email":email,
+                         "token":token,"expires_at":expiresAt},"status code":200}
      except Exception as e:
          return {"error":e,"status code":400}
+
+
+@app.post('/logout')
+async def logout(authorization: str = Header(...)):
+    try:
+        token = authorization.partition(' ')[2]
+        result = await sessionStore.revoke(token)
+        return {"data":result.get('data'),"status code":200}
+    except Exception as e:
+        return {"error":e,"status code":400}
      
 
 @app.post('/summary')
@@ -51,42 +170,241 @@ async def summaryContent(file: UploadFile = File(...),
                          page_num: int = Form(...),
                          range: int = Form(...),
                          user_req: str = Form(...),
-                         user_id: UUID = Form(...)):
+                         user_id: UUID = Form(...),
+                         mode: str = Form('sync'),
+                         durable: bool = Form(False),
+                         session_user: str | None = Depends(sessionUser)):
     
+    authorizeUser(user_id,session_user)
     try:
         if not file.filename:
             return {"data":'Upload the file(pdf,docx,csv,xlsx and txt)','status code':400}
         
-        data=f"file: {file}, page_num: {page_num}, range: {range}, user_request: {user_req} and userId: {user_id}"
-        print("Request body: ",data)
-        
-        print(f"type of user_id: {type(user_id)}")
-        
-        print(f"file: {file.file}")
-        print(f"file name: {file.filename}")
-        
+        logger.debug("Request body: file: %s, page_num: %s, range: %s, user_request: %s and userId: %s",
+                     file.filename,page_num,range,user_req,user_id)
+
+        file_type = uploadFileType(file.filename)
+        logger.debug("file type: %s",file_type)
 
-        file_type = file.filename.split('.')[-1]
-        print('file type: ',file_type)
+        try:
+            upload = await spoolUpload(file)
+        except uploadTooLarge:
+            uploadStats.reject()
+            return {"data":f'File should be at most {config.MAX_UPLOAD_BYTES} bytes','status code':413}
 
-        result = summaryService(file.file,file_type,user_id)
+        if mode=='job':
+            jobId = await summaryJobs.submit(upload,file_type,user_id,page_num,range)
+            if jobId is None:
+                upload.close()
+                return {"data":'Job queue is full, try again later','status code':503}
+            return {"data":{"job_id":jobId,"state":'queued'},'status code':202}
 
-        return {"data": result, 'status code':200}
+        try:
+            summaryId = uuid4()
+            result = await asyncSummaryService(upload,file_type,user_id,page_num,range,summaryId,durable)
+        finally:
+            upload.close()
+
+        if isinstance(result,dict) and result.get('status code')==400:
+            return {"data":result['error'],'status code':400}
+
+        return {"data": result, "summary_id": str(summaryId), 'status code':200}
         
     except Exception as e:
         return {"error":e,'status code':400}
     
 
+@app.post('/summary/stream')
+async def summaryStream(file: UploadFile = File(...),
+                        page_num: int = Form(...),
+                        range: int = Form(...),
+                        user_req: str = Form(...),
+                        user_id: UUID = Form(...),
+                        session_user: str | None = Depends(sessionUser)):
+    authorizeUser(user_id,session_user)
+    if not file.filename:
+        return {"data":'Upload the file(pdf,docx,csv,xlsx and txt)','status code':400}
+
+    file_type = uploadFileType(file.filename)
+    try:
+        upload = await spoolUpload(file)
+    except uploadTooLarge:
+        uploadStats.reject()
+        return {"data":f'File should be at most {config.MAX_UPLOAD_BYTES} bytes','status code':413}
+
+    return StreamingResponse(closeAfterStream(upload,asyncSummaryStream(upload,file_type,user_id,page_num,range)),
+                             media_type='text/event-stream',
+                             headers={'Cache-Control':'no-cache','X-Accel-Buffering':'no'})
+
+
+@app.post('/summary/batch')
+async def summaryBatch(files: list[UploadFile] = File(...),
+                       user_id: UUID = Form(...),
+                       session_user: str | None = Depends(sessionUser)):
+    """Summarizes several files, or the files inside .zip uploads, and
+    streams one JSON line per file as each finishes."""
+    authorizeUser(user_id,session_user)
+    batch = []
+    try:
+        total = 0
+        for file in files:
+            if not file.filename:
+                continue
+            upload = await spoolUpload(file,min(config.MAX_UPLOAD_BYTES,config.BATCH_MAX_BYTES-total))
+            total += upload.size
+            file_type = uploadFileType(file.filename)
+            if file_type=='zip':
+                try:
+                    batch.extend(await asyncio.to_thread(expandZip,upload,config.BATCH_MAX_FILES-len(batch),config.BATCH_MAX_BYTES-total))
+                finally:
+                    upload.close()
+            else:
+                batch.append((file.filename,file_type,upload))
+            if len(batch)>config.BATCH_MAX_FILES:
+                raise uploadTooLarge(f"batch has more than {config.BATCH_MAX_FILES} files")
+    except (uploadTooLarge,zipfile.BadZipFile) as e:
+        for _,_,upload in batch:
+            upload.close()
+        if isinstance(e,uploadTooLarge):
+            uploadStats.reject()
+            return {"data":str(e),'status code':413}
+        return {"data":'zip file is not valid','status code':400}
+
+    if not batch:
+        return {"data":'Upload the files(pdf,docx,csv,xlsx,txt or zip)','status code':400}
+
+    return StreamingResponse(closeBatchAfterStream(batch,asyncBatchSummaryService(batch,user_id)),
+                             media_type='application/x-ndjson',
+                             headers={'Cache-Control':'no-cache','X-Accel-Buffering':'no'})
+
+
+@app.get('/summary/{summary_id}/download')
+async def downloadSummary(summary_id: UUID, userid: UUID, format: str = 'pdf',
+                          session_user: str | None = Depends(sessionUser)):
+    authorizeUser(userid,session_user)
+    try:
+        if format not in artifactTypes:
+            return {"data":'format should be pdf or docx','status code':400}
+
+        data = await asyncSummaryArtifact(summary_id,userid,format)
+        if data is None:
+            return {"data":'There is no summary with this id','status code':404}
+
+        format = artifactFormat(data,format)
+        return Response(content=data,media_type=artifactTypes[format],
+                        headers={'Content-Disposition':f'attachment; filename="{summary_id}_summary.{format}"'})
+    except Exception as e:
+        return {"error":e,'status code':400}
+
+
 @app.get("/getHistory")
-async def historySummary(userid: UUID):
+async def historySummary(userid: UUID,
+                         limit: int = config.HISTORY_PAGE_SIZE,
+                         cursor: str | None = None,
+                         include_content: bool = False,
+                         session_user: str | None = Depends(sessionUser)):
+    authorizeUser(userid,session_user)
     try:
-        print("userid",userid)
         if not userid:
             return {"data":"There is no userid","status code":400}
-        result = fetchHistoryService(userid)
+        result = await asyncFetchHistoryService(userid,limit,cursor,include_content)
+        return {"data":result,"statusCode":200}
+    except Exception as e:
+        return {"error":e,"status code":400}
+
+@app.get("/searchHistory")
+async def searchHistory(userid: UUID,
+                        q: str,
+                        limit: int = config.SEARCH_PAGE_SIZE,
+                        cursor: str | None = None,
+                        in_content: bool = False,
+                        session_user: str | None = Depends(sessionUser)):
+    authorizeUser(userid,session_user)
+    try:
+        if not q.strip():
+            return {"data":"Search text should be non-empty","status code":400}
+        result = await asyncSearchHistoryService(userid,q,limit,cursor,in_content)
         return {"data":result,"statusCode":200}
     except Exception as e:
         return {"error":e,"status code":400}
 
+@app.get("/semanticSearch")
+async def semanticSearch(userid: UUID,
+                         q: str,
+                         k: int = config.VECTOR_TOP_K,
+                         session_user: str | None = Depends(sessionUser)):
+    authorizeUser(userid,session_user)
+    try:
+        if not q.strip():
+            return {"data":"Search text should be non-empty","status code":400}
+        result = await asyncSemanticSearchService(userid,q,k)
+        return {"data":result,"statusCode":200}
+    except Exception as e:
+        return {"error":e,"status code":400}
+
+@app.get("/jobs/{job_id}")
+async def jobStatus(job_id: UUID, session_user: str | None = Depends(sessionUser)):
+    try:
+        result = await summaryJobs.status(str(job_id))
+        if result is None or (session_user is not None and result['user_id']!=session_user):
+            return {"data":"There is no job with this id","status code":404}
+        return {"data":result,"statusCode":200}
+    except Exception as e:
+        return {"error":e,"status code":400}
+
+@app.get("/jobStats")
+async def jobStats():
+    return {"data":summaryJobs.stats(),"statusCode":200}
+
+@app.get("/historyStats")
+async def historyStats():
+    return {"data":historyWriter.stats(),"statusCode":200}
+
+@app.get("/vectorStats")
+async def vectorStats():
+    return {"data":vectorIndex.stats(),"statusCode":200}
+
+@app.get("/models/status")
+async def modelStatus():
+    return {"data":{**await modelRegistry.status(),"token_budget":tokenBudgeter.stats()},"statusCode":200}
+
+@app.get("/uploadStats")
+async def uploadStatistics():
+    return {"data":uploadStats.stats(),"statusCode":200}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of stage timings plus component gauges."""
+    jobs = summaryJobs.stats()
+    gauges = {
+        "summary_jobs_queue_depth":("Queued background summary jobs",{():jobs["queue_depth"]}),
+        "summary_jobs_busy_workers":("Job workers running a summary",{():jobs["busy_workers"]}),
+        "history_writer_queue_depth":("History rows waiting to be flushed",{():historyWriter.stats()["queue_depth"]}),
+        "vector_index_queue_depth":("Summaries waiting to be embedded",{():vectorIndex.stats()["queue_depth"]}),
+    }
+    pool = poolStats()
+    if pool is not None:
+        gauges["db_pool_connections"] = ("Postgres pool connections by state",
+                                         {(("state","in_use"),):pool["in_use"],(("state","idle"),):pool["idle"]})
+        gauges["db_pool_max_connections"] = ("Postgres pool size limit",{():pool["max"]})
+    uploads = uploadStats.stats()
+    gauges["upload_memory_bytes_peak"] = ("Largest upload body held in memory",{():uploads["upload_memory_bytes_peak"]})
+    gauges["uploads_spooled_to_disk"] = ("Upload bodies spooled to disk rather than memory",{():uploads["spooled_to_disk"]})
+    gauges["uploads_rejected"] = ("Uploads refused for exceeding the size limit",{():uploads["rejected"]})
+    gauges["process_peak_resident_memory_bytes"] = ("Peak resident set size of the process",{():uploads["process_peak_rss_bytes"]})
+    if uploads["process_rss_bytes"] is not None:
+        gauges["process_resident_memory_bytes"] = ("Resident set size of the process",{():uploads["process_rss_bytes"]})
+    cache = summaryCacheStore.stats()
+    gauges["summary_cache_lookups"] = ("Summary cache lookups by outcome",
+                                       {(("outcome","memory_hit"),):cache["memory_hits"],
+                                        (("outcome","db_hit"),):cache["db_hits"],
+                                        (("outcome","miss"),):cache["misses"]})
+    return Response(content=metricsRegistry.render(gauges),media_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.get("/cacheStats")
+async def cacheStats():
+    return {"data":{"summaries":summaryCacheStore.stats(),"artifacts":artifactStore.stats(),
+                    "sessions":sessionStore.stats()},"statusCode":200}
+
 if __name__=='__main__':
     uvicorn.run(app,port=8000)
\ No newline at end of file
@@ -0,0 +1,156 @@
+import bisect
+import threading
+import time
+from uploads import fileTypes
+
+# seconds; covers cache hits through multi-minute map-reduce runs
+latencyBuckets = (0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60,120,300)
+
+
+def fileTypeLabel(file_type):
+    # bounded like the route label: a raw upload extension would open new
+    # series for every distinct file name
+    if file_type is None:
+        return 'unknown'
+    return file_type if file_type in fileTypes else 'other'
+
+
+def escapeLabel(value):
+    return str(value).replace('\\','\\\\').replace('"','\\"').replace('\n','\\n')
+
+
+def labelText(names,values):
+    if not names:
+        return ''
+    return '{'+','.join(f'{name}="{escapeLabel(value)}"' for name,value in zip(names,values))+'}'
+
+
+class histogram:
+    """Cumulative-bucket latency histogram keyed by label values."""
+
+    def __init__(self,name,help,labels=(),buckets=latencyBuckets):
+        self.name=name
+        self.help=help
+        self.labels=tuple(labels)
+        self.buckets=tuple(buckets)
+        self.lock=threading.Lock()
+        self.series={}
+
+    def observe(self,value,*labelValues):
+        index=bisect.bisect_left(self.buckets,value)
+        with self.lock:
+            series=self.series.get(labelValues)
+            if series is None:
+                series=self.series[labelValues]={"counts":[0]*(len(self.buckets)+1),"sum":0.0,"count":0}
+            series["counts"][index]+=1
+            series["sum"]+=value
+            series["count"]+=1
+
+    def render(self):
+        lines=[f"# HELP {self.name} {self.help}",f"# TYPE {self.name} histogram"]
+        with self.lock:
+            snapshot={key:(list(s["counts"]),s["sum"],s["count"]) for key,s in self.series.items()}
+        for labelValues,(counts,total,count) in sorted(snapshot.items()):
+            cumulative=0
+            for bound,bucketCount in zip(self.buckets+(float('inf'),),counts):
+                cumulative+=bucketCount
+                le='+Inf' if bound==float('inf') else repr(float(bound))
+                lines.append(f"{self.name}_bucket{labelText(self.labels+('le',),labelValues+(le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{labelText(self.labels,labelValues)} {total}")
+            lines.append(f"{self.name}_count{labelText(self.labels,labelValues)} {count}")
+        return lines
+
+
+class counter:
+    """Monotonic counter, or a gauge when kind='gauge', keyed by label values."""
+
+    def __init__(self,name,help,labels=(),kind='counter'):
+        self.name=name
+        self.help=help
+        self.labels=tuple(labels)
+        self.kind=kind
+        self.lock=threading.Lock()
+        self.values={}
+
+    def inc(self,*labelValues,amount=1):
+        with self.lock:
+            self.values[labelValues]=self.values.get(labelValues,0)+amount
+
+    def dec(self,*labelValues,amount=1):
+        self.inc(*labelValues,amount=-amount)
+
+    def render(self):
+        lines=[f"# HELP {self.name} {self.help}",f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            values=sorted(self.values.items())
+        for labelValues,value in values:
+            lines.append(f"{self.name}{labelText(self.labels,labelValues)} {value}")
+        return lines
+
+
+class stageSpan:
+    """Times one pipeline stage; usable as `with` in sync and async code."""
+
+    def __init__(self,registry,stage,file_type):
+        self.registry=registry
+        self.stage=stage
+        self.file_type=fileTypeLabel(file_type)
+
+    def __enter__(self):
+        self.registry.stageInFlight.inc(self.stage)
+        self.started=time.perf_counter()
+        return self
+
+    def __exit__(self,excType,exc,tb):
+        elapsed=time.perf_counter()-self.started
+        self.registry.stageInFlight.dec(self.stage)
+        self.registry.stageSeconds.observe(elapsed,self.stage,self.file_type)
+        if excType is not None:
+            self.registry.stageErrors.inc(self.stage,self.file_type)
+        return False
+
+
+class summaryMetrics:
+    """Process-wide metrics, rendered in the Prometheus text format.
+
+    file_type labels are collapsed to fileTypes, 'other' or 'unknown'.
+    span(stage, file_type) records a summary_stage_seconds observation and
+    holds a summary_stage_in_flight slot for its duration. Gauges owned by
+    other components (DB pool, job queue, caches) are passed to render()
+    as a snapshot so /metrics never has to import them here.
+    """
+
+    def __init__(self):
+        self.stageSeconds=histogram('summary_stage_seconds','Time spent in each summary pipeline stage',('stage','file_type'))
+        self.stageInFlight=counter('summary_stage_in_flight','Pipeline stages currently running',('stage',),kind='gauge')
+        self.stageErrors=counter('summary_stage_errors_total','Pipeline stages that raised',('stage','file_type'))
+        self.requestSeconds=histogram('http_request_seconds','HTTP request latency',('method','route','status'))
+        self.requestsInFlight=counter('http_requests_in_flight','HTTP requests being handled',kind='gauge')
+        self.tokens=counter('summary_tokens_total','Model tokens by direction',('file_type','direction'))
+
+    def span(self,stage,file_type=None):
+        return stageSpan(self,stage,file_type)
+
+    def recordUsage(self,file_type,usage):
+        if not usage:
+            return
+        label=fileTypeLabel(file_type)
+        self.tokens.inc(label,'prompt',amount=usage.get("prompt_tokens") or 0)
+        self.tokens.inc(label,'completion',amount=usage.get("completion_tokens") or 0)
+
+    def render(self,gauges=None):
+        """gauges is {metric name: (help, {((label, value), ...): sample})}."""
+        lines=[]
+        for metric in (self.stageSeconds,self.stageInFlight,self.stageErrors,
+                       self.requestSeconds,self.requestsInFlight,self.tokens):
+            lines.extend(metric.render())
+        for name,(help,samples) in sorted((gauges or {}).items()):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels,value in samples.items():
+                names,values=zip(*labels) if labels else ((),())
+                lines.append(f"{name}{labelText(names,values)} {value}")
+        return '\n'.join(lines)+'\n'
+
+
+metricsRegistry=summaryMetrics()
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import threading
+import time
+from langchain_ollama.chat_models import ChatOllama
+from langchain_ollama.embeddings import OllamaEmbeddings
+from ollama import AsyncClient
+from prompts import summaryPrompt,chunkPrompt
+import config
+
+logger = logging.getLogger(__name__)
+
+preloadFileTypes = ['pdf','docx','csv','txt']
+
+
+class ollamaModelRegistry:
+    """Shared ChatOllama client and prebuilt prompt chains.
+
+    One client is reused for every request (it pools its HTTP
+    connections), chains are built once per file type, and start()
+    loads the model into Ollama with keep_alive so the first user
+    request does not pay the model-load cost. The native client used for
+    warmup and status is shared too and closed by stop().
+    """
+
+    def __init__(self):
+        self.model=config.OLLAMA_MODEL
+        self.options={"temperature":config.OLLAMA_TEMPERATURE,"keep_alive":config.OLLAMA_KEEP_ALIVE}
+        if config.OLLAMA_NUM_CTX:
+            self.options["num_ctx"]=config.OLLAMA_NUM_CTX
+        if config.OLLAMA_BASE_URL:
+            self.options["base_url"]=config.OLLAMA_BASE_URL
+        self.client=None
+        self.ollama=None
+        self.embeddings=None
+        self.chains={}
+        self.lock=threading.Lock()
+        self.state='cold'
+        self.warmupMs=None
+        self.loadedAt=None
+        self.error=None
+
+    def chatModel(self):
+        if self.client is None:
+            with self.lock:
+                if self.client is None:
+                    self.client=ChatOllama(model=self.model,**self.options)
+        return self.client
+
+    def embeddingModel(self):
+        if self.embeddings is None:
+            with self.lock:
+                if self.embeddings is None:
+                    baseUrl={"base_url":config.OLLAMA_BASE_URL} if config.OLLAMA_BASE_URL else {}
+                    self.embeddings=OllamaEmbeddings(model=config.EMBED_MODEL,**baseUrl)
+        return self.embeddings
+
+    def chain(self,kind,file_type,promptBuilder):
+        key=(kind,file_type)
+        chain=self.chains.get(key)
+        if chain is None:
+            chain=promptBuilder(file_type) | self.chatModel()
+            with self.lock:
+                chain=self.chains.setdefault(key,chain)
+        return chain
+
+    def summaryChain(self,file_type):
+        return self.chain('summary',file_type,summaryPrompt)
+
+    def chunkChain(self,file_type):
+        return self.chain('chunk',file_type,chunkPrompt)
+
+    async def start(self):
+        for file_type in preloadFileTypes:
+            self.summaryChain(file_type)
+            self.chunkChain(file_type)
+        if config.OLLAMA_PRELOAD:
+            await self.warmup()
+
+    async def warmup(self):
+        # An empty generate request only loads the model and applies keep_alive
+        self.state='loading'
+        started=time.perf_counter()
+        try:
+            await asyncio.wait_for(self.ollamaClient().generate(model=self.model,prompt='',keep_alive=config.OLLAMA_KEEP_ALIVE),
+                                   timeout=config.OLLAMA_WARMUP_TIMEOUT)
+            self.warmupMs=round((time.perf_counter()-started)*1000)
+            self.loadedAt=time.time()
+            self.state='warm'
+            self.error=None
+        except Exception as e:
+            logger.warning("Model warmup failed: %s",e)
+            self.state='cold'
+            self.error=str(e)
+
+    def ollamaClient(self):
+        # one native client for warmup and status calls, closed by stop()
+        if self.ollama is None:
+            self.ollama=AsyncClient(host=config.OLLAMA_BASE_URL) if config.OLLAMA_BASE_URL else AsyncClient()
+        return self.ollama
+
+    async def stop(self):
+        if self.ollama is not None:
+            client,self.ollama=self.ollama,None
+            await client.close()
+
+    async def status(self):
+        """Reports whether Ollama currently has the model loaded."""
+        try:
+            running=await asyncio.wait_for(self.ollamaClient().ps(),timeout=5)
+            loaded=[model for model in running.models if model.model==self.model or model.name==self.model]
+            if self.state!='loading':
+                self.state='warm' if loaded else 'cold'
+            expiresAt=loaded[0].expires_at.isoformat() if loaded and loaded[0].expires_at else None
+        except Exception as e:
+            self.error=str(e)
+            expiresAt=None
+        return {"model":self.model,"state":self.state,"keep_alive":config.OLLAMA_KEEP_ALIVE,
+                "expires_at":expiresAt,"warmup_ms":self.warmupMs,"loaded_at":self.loadedAt,
+                "chains":len(self.chains),"error":self.error}
+
+
+modelRegistry=ollamaModelRegistry()
@@ -0,0 +1,67 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import fitz
+import config
+
+# Page-decoding workers for large PDFs. The task pickles as
+# pdf_pages.pdfPageText, so workers never need service itself; they fork
+# from a forkserver that has preloaded only this module and fitz (spawn is
+# the fallback where forkserver is unavailable). Like any non-fork worker
+# they still re-run the imports of the launching script, which is why the
+# pool is started with the app rather than by the first large PDF.
+pdfPoolLock = threading.Lock()
+pdfProcessPool = None
+
+
+def poolContext():
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def openPdf(source):
+    # source is a file path or an in-memory buffer
+    if isinstance(source,str):
+        return fitz.open(source,filetype='pdf')
+    return fitz.open(stream=source,filetype='pdf')
+
+
+def pdfPageText(source,start,end):
+    pdf=openPdf(source)
+    try:
+        return ''.join(pdf.load_page(number).get_text() for number in range(start,end))
+    finally:
+        pdf.close()
+
+
+def workerReady():
+    return True
+
+
+def pdfPagePool():
+    """The shared process pool, created once even under concurrent callers."""
+    global pdfProcessPool
+    with pdfPoolLock:
+        if pdfProcessPool is None:
+            pdfProcessPool = ProcessPoolExecutor(max_workers=config.PDF_PROCESS_WORKERS,mp_context=poolContext())
+        return pdfProcessPool
+
+
+def startPdfPagePool():
+    # spawn the workers at startup so no request pays their import time
+    if config.PDF_PROCESS_WORKERS<2:
+        return
+    pool = pdfPagePool()
+    for _ in range(config.PDF_PROCESS_WORKERS):
+        pool.submit(workerReady)
+
+
+def stopPdfPagePool():
+    global pdfProcessPool
+    with pdfPoolLock:
+        if pdfProcessPool is not None:
+            pdfProcessPool.shutdown(wait=False,cancel_futures=True)
+            pdfProcessPool = None
@@ -0,0 +1,60 @@
+from langchain_core.prompts import ChatPromptTemplate
+
+# Bump whenever the system prompt changes so cached summaries are not reused
+PROMPT_VERSION = '1'
+
+
+def summaryPrompt(file_type):
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", f"""
+Role:             
+-You are a professional English teacher with over 10 years of experience and strong summarization skills.
+
+Objective:
+-Your job is to clearly and concisely summarize content based on its file type.
+
+File Type: 
+-{file_type if file_type else 'pdf or docx or csv or xlsx or txt file'}
+
+Instructions:
+- You must always produce a clear and meaningful summary based on the input — even if the content is informal, unstructured, or minimal.
+- Do not generate SQL queries, programming code, shell commands, or advice.
+- Do not include anything that wasn’t directly found or implied in the original content.
+- Avoid hallucinating facts or adding hypothetical content.
+
+Formatting:
+        - Format your output using basic Markdown syntax that will be converted to a Word document.
+        - Use only the following Markdown elements:
+        - #, ##, ### for headings and subheadings
+        - - for bullet points
+        - **bold text** to emphasize key terms or sections
+        - Do not use any other Markdown (like links, tables, or images).
+        - Keep the summary clear and concise, following this structure:
+            - One main heading for the document title
+            - Section headings (## or ###) to group topics
+            - Bullet points under each section with optional bold keywords
+
+"""),
+        ("user", "{content}")
+    ])
+
+    return prompt
+
+
+def chunkPrompt(file_type):
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", f"""
+Role:
+-You are a professional English teacher with over 10 years of experience and strong summarization skills.
+
+Objective:
+-You will receive one part of a larger {file_type} document. Write concise bullet-point notes covering the key facts, figures and arguments of this part only.
+
+Instructions:
+- Do not include anything that wasn’t directly found or implied in the given part.
+- Do not add an introduction or conclusion; the notes will be merged with notes from the other parts.
+"""),
+        ("user", "Part {part} of {total}:\n{content}")
+    ])
+
+    return prompt
@@ -0,0 +1,102 @@
+import logging
+from db_connection import postgresDb
+from content_store import compressStoredBlobs,indexStoredBlobs
+import config
+
+logger = logging.getLogger(__name__)
+
+# Applied in order at startup; every statement must be safe to re-run.
+migrations=[
+    """CREATE EXTENSION IF NOT EXISTS "uuid-ossp";""",
+    """
+        Create Table if not exists UserBio(
+        user_id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+        name varchar(255),
+        email varchar(125),
+        password varchar(125))
+    """,
+    """
+        Create Table if not exists summaryHistory(
+        fileType varchar(20),
+        content text,
+        llmSummary text,
+        user_id UUID)
+    """,
+    # summary cache: sha256 of upload bytes, file type, model and prompt version
+    "ALTER TABLE summaryHistory ADD COLUMN IF NOT EXISTS cache_key char(64)",
+    "CREATE INDEX IF NOT EXISTS summaryhistory_cache_key_idx ON summaryHistory(cache_key)",
+    # stable id for downloading the rendered docx/pdf of a summary
+    "ALTER TABLE summaryHistory ADD COLUMN IF NOT EXISTS summary_id UUID DEFAULT uuid_generate_v4()",
+    "CREATE UNIQUE INDEX IF NOT EXISTS summaryhistory_summary_id_idx ON summaryHistory(summary_id)",
+    # keyset pagination for /getHistory
+    "ALTER TABLE summaryHistory ADD COLUMN IF NOT EXISTS created_at timestamptz DEFAULT now()",
+    "CREATE INDEX IF NOT EXISTS summaryhistory_user_created_idx ON summaryHistory(user_id,created_at DESC,summary_id DESC)",
+    """
+        Create Table if not exists userSession(
+        token_hash char(64) PRIMARY KEY,
+        user_id UUID NOT NULL,
+        created_at timestamptz DEFAULT now(),
+        expires_at timestamptz NOT NULL)
+    """,
+    "CREATE INDEX IF NOT EXISTS usersession_expires_idx ON userSession(expires_at)",
+    # token accounting per summary; 0 for cache hits, NULL for rows written before this
+    "ALTER TABLE summaryHistory ADD COLUMN IF NOT EXISTS prompt_tokens integer",
+    "ALTER TABLE summaryHistory ADD COLUMN IF NOT EXISTS completion_tokens integer",
+    # extracted text is stored once per sha256, compressed; history rows reference it
+    """
+        Create Table if not exists contentBlob(
+        content_hash char(64) PRIMARY KEY,
+        codec varchar(8) NOT NULL,
+        raw_size integer NOT NULL,
+        data bytea NOT NULL,
+        created_at timestamptz DEFAULT now())
+    """,
+    "ALTER TABLE summaryHistory ADD COLUMN IF NOT EXISTS content_hash char(64)",
+    "CREATE INDEX IF NOT EXISTS summaryhistory_content_hash_idx ON summaryHistory(content_hash)",
+    """
+        DO $$ BEGIN
+            ALTER TABLE summaryHistory ADD CONSTRAINT summaryhistory_content_hash_fk
+            FOREIGN KEY (content_hash) REFERENCES contentBlob(content_hash);
+        EXCEPTION WHEN duplicate_object THEN NULL;
+        END $$;
+    """,
+    # move inline content of older rows into blobs; compressStoredBlobs then
+    # compresses these 'none' blobs from Python
+    """
+        Insert into contentBlob(content_hash,codec,raw_size,data)
+        Select encode(sha256(convert_to(content,'UTF8')),'hex'),'none',octet_length(content),convert_to(content,'UTF8')
+        from summaryHistory where content is not null and content_hash is null
+        on conflict (content_hash) do nothing
+    """,
+    """
+        Update summaryHistory set content_hash=encode(sha256(convert_to(content,'UTF8')),'hex'),content=null
+        where content is not null and content_hash is null
+    """,
+    # full-text search: summaries via a generated column, extracted text on
+    # the blob (filled on insert; indexStoredBlobs backfills older blobs)
+    "CREATE EXTENSION IF NOT EXISTS btree_gin",
+    f"""
+        ALTER TABLE summaryHistory ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('{config.SEARCH_LANGUAGE}',coalesce(llmSummary,''))) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS summaryhistory_search_idx ON summaryHistory USING gin(user_id,search_vector)",
+    "ALTER TABLE contentBlob ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    "CREATE INDEX IF NOT EXISTS contentblob_search_idx ON contentBlob USING gin(search_vector)",
+]
+
+
+def applyMigrations():
+    try:
+        with postgresDb() as pg:
+            for query in migrations:
+                result=pg.create(query)
+                if result.get('error'):
+                    logger.error("Migration failed: %s",result['error'])
+                    return result
+            compressStoredBlobs(pg)
+            indexStoredBlobs(pg)
+        return {"data":'Schema up to date',"status code":200}
+
+    except Exception as e:
+        logger.exception("applyMigrations failed")
+        return {"error":e}
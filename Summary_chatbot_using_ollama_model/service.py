@@ -1,13 +1,40 @@
-from db_connection import postgresDb
-import fitz
+from db_connection import postgresDb,asyncPostgresDb
 from io import BytesIO
 from docx import Document
 import pandas as pd
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_ollama.chat_models import ChatOllama
 from fpdf import FPDF
-from docx2pdf import convert
+import asyncio
+import logging
+import json
 import os
+import string
+import functools
+import time
+import uuid
+import base64
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import config
+from summary_cache import summaryCacheKey,summaryCacheStore
+from chunking import countTokens,splitByTokens
+from token_budget import tokenBudgeter,emptyUsage,addUsage
+from artifact_cache import artifactStore
+from tabular_profile import profileCsv,profileXlsx
+from uploads import asUpload
+from prompts import PROMPT_VERSION
+from model_registry import modelRegistry
+from metrics import metricsRegistry,fileTypeLabel
+from history_writer import historyWriter
+from content_store import storedContent
+from pdf_pages import openPdf,pdfPagePool,pdfPageText
+from vector_index import vectorIndex
+
+logger = logging.getLogger(__name__)
+
+# Parsing, docx/pdf rendering and other blocking work for the async path
+# runs here so it never stalls the event loop
+blockingExecutor = ThreadPoolExecutor(max_workers=config.BLOCKING_WORKERS,thread_name_prefix='summary-worker')
+summarySlots = asyncio.Semaphore(config.MAX_CONCURRENT_SUMMARIES)
 
 def newUserService(userData: dict):
     try:
@@ -15,285 +42,860 @@ def newUserService(userData: dict):
         email=userData.email
         password= userData.password
 
-        pg= postgresDb()
-        
-        query="select email from userbio where email=%s"
-        existUser= pg.showData(query,(email,))
+        with postgresDb() as pg:
+            query="select email from userbio where email=%s"
+            existUser= pg.showData(query,(email,))
 
-        print(f"exist user status: {existUser}")
+            logger.debug("exist user status: %s",existUser)
 
-        if existUser.get('data'):
-            return "user already exist"
+            if existUser:
+                return "user already exist"
 
-        query="""
-                Insert into UserBio(name,email,password)
-                values(%s,%s,%s)
-            """
-        values=(name,email,password)
+            query="""
+                    Insert into UserBio(name,email,password)
+                    values(%s,%s,%s)
+                """
+            values=(name,email,password)
 
-        insertNewUser = pg.insertData(query,values)
+            insertNewUser = pg.insertData(query,values)
         
-        print("New user status",insertNewUser['data'])
+        logger.info("New user status: %s",insertNewUser['data'])
         return insertNewUser['data']
     
     except Exception as e:
-        print(f"Error in newUserService function: {e}")
+        logger.exception("Error in newUserService function")
         return {"error":e,"status code":400}
-    
-    finally:
-        pg.disconnect()
 
 def loginService(userData:dict):
     try:
         email= userData.email
         password = userData.password
 
-        pg= postgresDb()
-        
         query="""
-               Select * from userBio
+               Select user_id,name,email from userBio
                where email=%s and password=%s
          """
         values=(email,password)
 
-        loginUser=pg.showData(query,values)
+        with postgresDb() as pg:
+            loginUser=pg.showData(query,values)
 
-        print("login user status: ",loginUser)
+        logger.debug("login user found: %s",bool(loginUser))
 
-        if not loginUser.get('data'):
+        if not loginUser:
             return "Invalid credentials"
 
         return loginUser
 
     except Exception as e:
-        print(f"Error in loginService function: {e}")
+        logger.exception("Error in loginService function")
         return {"error":e,"status code":400}
-    
+
+
+class pageOutOfRange(ValueError):
+    """The requested page window starts past the last page of the PDF."""
+
+
+def pageWindow(page_num,page_range):
+    """Normalises the page_num/range form fields: page_num is the 1-based
+    first page, range the number of pages from there. Zero or missing
+    values mean "from the first page" and "to the last page"."""
+    start = max(page_num or 1,1)-1
+    count = page_range if page_range and page_range>0 else None
+    return start,count
+
+
+def pdfExtract(content,page_num=None,page_range=None):
+    """Decodes only the requested pages, raising pageOutOfRange when the
+    window starts past the last page. Spans longer than
+    PDF_PARALLEL_MIN_PAGES are split across a process pool.
+
+    Spooled uploads are opened by path so MuPDF reads pages from disk."""
+
+    upload = asUpload(content)
+    source = upload.path or upload.data
+    start,count = pageWindow(page_num,page_range)
+    pdf=openPdf(source)
+    try:
+        end = pdf.page_count if count is None else min(start+count,pdf.page_count)
+        if start>=end:
+            raise pageOutOfRange(f"page {start+1} is past the last page of the document ({pdf.page_count} pages)")
+        pages = end-start
+        if pages<config.PDF_PARALLEL_MIN_PAGES or config.PDF_PROCESS_WORKERS<2:
+            return ''.join(pdf.load_page(number).get_text() for number in range(start,end))
     finally:
-        pg.disconnect()
+        pdf.close()
+
+    step = -(-pages//config.PDF_PROCESS_WORKERS)
+    bounds = [(first,min(first+step,end)) for first in range(start,end,step)]
+    parts = pdfPagePool().map(pdfPageText,[source]*len(bounds),*zip(*bounds))
+    return ''.join(parts)
+
+
+def docExtract(content):
+    with asUpload(content).open() as source:
+        docRead=Document(source)
+    return ''.join([para.text for para in docRead.paragraphs])
+
+
+def csvExtract(content):
+    with asUpload(content).open() as source:
+        if config.TABULAR_MODE=='profile':
+            return profileCsv(source)
+        return pd.read_csv(source).to_string()
+
+
+def xlsxExtract(content):
+    with asUpload(content).open() as source:
+        if config.TABULAR_MODE=='profile':
+            return profileXlsx(source)
+        return pd.read_excel(source).to_string()
+
+
+def txtExtract(content):
+    with asUpload(content).view() as view:
+        return str(view,'utf-8')
+
+
+def extractContent(content,file_type,page_num=None,page_range=None):
+    """Returns (text, prompt file type) for the uploaded bytes or spooledUpload."""
+    if file_type=='pdf':
+        return pdfExtract(content,page_num,page_range),'pdf'
+    elif file_type=='docx':
+        return docExtract(content),'docx'
+    elif file_type=='csv':
+        return csvExtract(content),'csv'
+    elif file_type=='xlsx':
+        return xlsxExtract(content),'csv'
+    else:
+        return txtExtract(content),'txt'
+
+
+def summaryChain(file_type):
+    return modelRegistry.summaryChain(file_type)
+
+
+def chunkChain(file_type):
+    return modelRegistry.chunkChain(file_type)
+
 
+def chunkInputs(content,file_type):
+    maxTokens = min(config.CHUNK_TOKENS,tokenBudgeter.contentBudget(file_type,'chunk'))
+    chunks = splitByTokens(content,maxTokens)
+    return [{"content":chunk,"part":i,"total":len(chunks)} for i,chunk in enumerate(chunks,1)]
 
-def summaryService(file,file_type,user_id):
+
+def joinChunkNotes(notes):
+    return "\n\n".join(f"Part {i}:\n{note.content}" for i,note in enumerate(notes,1))
+
+
+def addChunkUsage(usage,file_type,inputs,notes):
+    overhead = tokenBudgeter.templateTokens('chunk',file_type)
+    for chunk,note in zip(inputs,notes):
+        addUsage(usage,note,overhead+countTokens(chunk["content"]))
+
+
+async def asyncCondenseContent(content,file_type,usage=None):
+    """Fits content into the summary prompt's token budget.
+
+    tokenBudgeter picks the strategy: content that fits is passed
+    through, a small overflow is trimmed, anything larger goes through
+    the map step (per-chunk notes summarized in parallel) until it fits,
+    for at most MAX_MAP_ROUNDS. The caller's summaryChain is the reduce
+    step. Map-call token counts are added to usage.
+    """
+    plan = tokenBudgeter.plan(content,file_type)
+    if plan["strategy"]=='chunked':
+        for _ in range(config.MAX_MAP_ROUNDS):
+            inputs = await runBlocking(chunkInputs,content,file_type)
+            with metricsRegistry.span('llm_map',file_type):
+                notes = await chunkChain(file_type).abatch(inputs,config={"max_concurrency":config.MAP_CONCURRENCY})
+            addChunkUsage(usage,file_type,inputs,notes)
+            content = joinChunkNotes(notes)
+            if countTokens(content)<=plan["budget"]:
+                break
+    return tokenBudgeter.fit(content,plan["budget"])
+
+
+def summaryPromptTokens(content,file_type):
+    # estimate used when Ollama does not report prompt_eval_count
+    return tokenBudgeter.templateTokens('summary',file_type)+countTokens(content)
+
+
+artifactTypes = {
+    'docx':'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'pdf':'application/pdf',
+}
+
+def renderSummaryArtifacts(summary,file_type=None):
+    with metricsRegistry.span('render_docx',file_type):
+        docx = convertSummaryToDocxBytes(summary)
+    with metricsRegistry.span('render_pdf',file_type):
+        pdf = convertSummaryToPdfBytes(summary)
+    # no font for the summary's script: the docx stands in for the pdf
+    return {'docx':docx,'pdf':pdf if pdf is not None else docx}
+
+
+def artifactFormat(data,fmt):
+    """The format data is really in; a pdf request may get the docx."""
+    return 'docx' if fmt=='pdf' and not data.startswith(b'%PDF') else fmt
+
+
+def renderAndStoreArtifacts(summary_id,userid,summary,file_type=None):
+    # artifactStore may spill to disk, so this stays off the event loop
+    artifacts = renderSummaryArtifacts(summary,file_type)
+    for fmt,data in artifacts.items():
+        artifactStore.put(summary_id,userid,fmt,data)
+    return artifacts
+
+
+async def storeSummaryArtifacts(summary_id,userid,summary,file_type=None):
+    return await runBlocking(renderAndStoreArtifacts,summary_id,userid,summary,file_type)
+
+
+def summaryRow(userid,content,llmresponse,file_type,cache_key=None,summary_id=None,usage=None):
+    usage = usage or {}
+    return (file_type,content,llmresponse,str(userid),cache_key,str(summary_id or uuid.uuid4()),
+            usage.get("prompt_tokens"),usage.get("completion_tokens"))
+
+# Core PDF fonts only cover latin-1
+pdfCharReplacements = str.maketrans({"‘":"'","’":"'","“":'"',"”":'"',"–":"-","—":"-","•":"-","…":"..."})
+
+def pdfSafe(text):
+    return text.translate(pdfCharReplacements).encode('latin-1','replace').decode('latin-1')
+
+
+def fitsCoreFonts(text):
     try:
-        if file_type=='pdf':
-            data = pdfService(user_id,file,file_type)
-            print("pdf summary:",data)
-            return data
-        
-        elif file_type=='docx':
-            data = docService(user_id,file,file_type)
-            print("Document summary: ",data)
-            return data
-        
-        elif file_type=='csv':
-            csv_read= pd.read_csv(BytesIO(file.read()))
-            content = csv_read.to_string()
-            response = llmService(user_id,content,'csv')
-            print("csv summary",response)
-            insertLLMSummary(user_id,content,response,file_type)
-            return response
-        
-        elif file_type=='xlsx':
-            data = pd.read_excel(BytesIO(file.read()))
-            content = data.to_string()
-            response = llmService(user_id,content,'csv')
-            print("xlsx summary",response)
-            insertLLMSummary(user_id,content,response,file_type)
-            return response
+        text.translate(pdfCharReplacements).encode('latin-1')
+        return True
+    except UnicodeEncodeError:
+        return False
+
+
+@functools.lru_cache(maxsize=4)
+def fontCharacters(path):
+    from fontTools.ttLib import TTFont
+    with TTFont(path,lazy=True) as font:
+        return frozenset(chr(point) for point in font.getBestCmap())
+
+
+def pdfUnicodeFonts(text):
+    """(regular, bold) TrueType paths that have a glyph for every
+    character of text, or None."""
+    regular = config.PDF_FONT_PATH
+    if not regular or not os.path.exists(regular):
+        return None
+    bold = config.PDF_BOLD_FONT_PATH
+    fonts = (regular,bold if bold and os.path.exists(bold) else regular)
+    needed = set(text)-set(string.whitespace)
+    if any(not needed<=fontCharacters(path) for path in set(fonts)):
+        return None
+    return fonts
+
+
+def pdfRuns(text,unicode=False):
+    """Splits **bold** markup into (word, bold) pairs."""
+    words = []
+    for i, part in enumerate((text if unicode else pdfSafe(text)).split("**")):
+        words.extend((word, i % 2 == 1) for word in part.split())
+    return words
+
+
+class summaryPdfWriter:
+    """Minimal line layout on top of FPDF.text().
+
+    FPDF.write()/multi_cell() re-measure the whole pending line for every
+    character, which dominates render time on long summaries; measuring
+    words from the font width tables and placing finished lines directly
+    is much cheaper. fonts=(regular, bold) TrueType paths switch from the
+    latin-1 core Helvetica to a Unicode font.
+    """
+
+    def __init__(self,fonts=None):
+        self.pdf = FPDF()
+        self.pdf.set_auto_page_break(auto=False)
+        self.family = "Helvetica"
+        if fonts:
+            self.family = "SummaryUnicode"
+            self.pdf.add_font(self.family,"",fonts[0])
+            self.pdf.add_font(self.family,"B",fonts[1])
+        self.pdf.add_page()
+        self.y = self.pdf.t_margin
+        self.bottom = self.pdf.h-self.pdf.b_margin
+        self.right = self.pdf.w-self.pdf.r_margin
+
+    def newLine(self,lineHeight):
+        if self.y+lineHeight>self.bottom:
+            self.pdf.add_page()
+            self.y = self.pdf.t_margin
+        self.y += lineHeight
+
+    def block(self,words,size,left,lineHeight,prefix=None):
+        pdf = self.pdf
+        # per-character width tables in 1/1000 em: keyed by character for
+        # the core fonts, by code point for TrueType ones
+        charWidths = {}
+        for bold in (False,True):
+            pdf.set_font(self.family,"B" if bold else "",size)
+            charWidths[bold] = pdf.current_font.cw
+        scale = size/1000/pdf.k
+        byCodePoint = self.family!="Helvetica"
+        def measure(word,bold):
+            table = charWidths[bold]
+            if byCodePoint:
+                return sum(table[ord(char)] for char in word)*scale
+            return sum(table.get(char,500) for char in word)*scale
+        space = measure(" ",False)
+
+        # scripts written without spaces (CJK) come in as one long word;
+        # break those wherever the line is full
+        pieces = []
+        for word,bold in words:
+            if measure(word,bold)<=self.right-left:
+                pieces.append((word,bold))
+                continue
+            piece,pieceWidth = "",0
+            for char in word:
+                charWidth = measure(char,bold)
+                if piece and pieceWidth+charWidth>self.right-left:
+                    pieces.append((piece,bold))
+                    piece,pieceWidth = "",0
+                piece += char
+                pieceWidth += charWidth
+            pieces.append((piece,bold))
+
+        lines = [[]]
+        x = left
+        for word,bold in pieces:
+            width = measure(word,bold)
+            if lines[-1] and x+width>self.right:
+                lines.append([])
+                x = left
+            lines[-1].append((word,bold,x))
+            x += width+space
+
+        for number,line in enumerate(lines):
+            self.newLine(lineHeight)
+            if prefix and number==0:
+                pdf.set_font(self.family,"",size)
+                pdf.text(left-pdf.get_string_width(prefix),self.y,prefix)
+            # one text() call per run of same-weight words
+            runStart = 0
+            for i in range(1,len(line)+1):
+                if i==len(line) or line[i][1]!=line[runStart][1]:
+                    pdf.set_font(self.family,"B" if line[runStart][1] else "",size)
+                    pdf.text(line[runStart][2],self.y," ".join(word for word,_,_ in line[runStart:i]))
+                    runStart = i
+
+    def gap(self,height):
+        self.y += height
+
+    def output(self):
+        return bytes(self.pdf.output())
+
+
+def convertSummaryToPdfBytes(response):
+    """Renders the same Markdown subset as buildSummaryDocx (#/##/###
+    headings, "- " bullets, **bold**) straight to PDF bytes in memory.
+
+    Text outside latin-1 is set in the PDF_FONT_PATH font; returns None
+    when that font is missing or lacks some of the glyphs, rather than
+    printing "?" or blanks for them."""
+    unicode = not fitsCoreFonts(response)
+    fonts = pdfUnicodeFonts(response) if unicode else None
+    if unicode and fonts is None:
+        return None
+    writer = summaryPdfWriter(fonts)
+    margin = writer.pdf.l_margin
+    headingSizes = {1:18,2:15,3:13}
+
+    def runs(text):
+        return pdfRuns(text,unicode)
+
+    def heading(text,level):
+        size = headingSizes[level]
+        writer.gap(2)
+        writer.block([(word,True) for word,_ in runs(text)],size,margin,size*0.5)
+        writer.gap(2)
+
+    heading("Summary",1)
+
+    for line in response.splitlines():
+        line = line.strip()
+
+        if line.startswith("### "):
+            heading(line[4:],3)
+        elif line.startswith("## "):
+            heading(line[3:],2)
+        elif line.startswith("# "):
+            heading(line[2:],1)
+        elif line.startswith("- "):
+            writer.block(runs(line[2:]),11,margin+8,6,prefix="- ")
+        elif line:
+            writer.block(runs(line),11,margin,6)
+
+    return writer.output()
+
+
+def buildSummaryDocx(response):
+    doc = Document()
+
+    doc.add_heading("Summary", level=1)
+
+    for line in response.splitlines():
+        line = line.strip()
+
+        if line.startswith("### "):  # H3
+            doc.add_heading(line[4:].strip(), level=3)
+        elif line.startswith("## "):  # H2
+            doc.add_heading(line[3:].strip(), level=2)
+        elif line.startswith("# "):   # H1
+            doc.add_heading(line[2:].strip(), level=1)
+        elif line.startswith("- "):   # Bullet point
+            clean_line = line[2:].strip()
+
+            if "**" in clean_line:
+                parts = clean_line.split("**")
+                paragraph = doc.add_paragraph(style="List Bullet")
+                for i, part in enumerate(parts):
+                    if i % 2 == 1:
+                        run = paragraph.add_run(part)
+                        run.bold = True
+                    else:
+                        paragraph.add_run(part)
+            else:
+                doc.add_paragraph(clean_line, style="List Bullet")
+
+        elif line:
+            paragraph = doc.add_paragraph()
+
+            if "**" in line:
+                parts = line.split("**")
+                for i, part in enumerate(parts):
+                    if i % 2 == 1:
+                        run = paragraph.add_run(part)
+                        run.bold = True
+                    else:
+                        paragraph.add_run(part)
+            else:
+                paragraph.add_run(line)
+    return doc
+
+
+def convertSummaryToDocxBytes(response):
+    buffer = BytesIO()
+    buildSummaryDocx(response).save(buffer)
+    return buffer.getvalue()
+
+
+async def asyncCopyCachedSummary(userid,cache_key,summary_id,wait=False):
+    # Records the cache hit in the user's history without shipping the
+    # content back and forth
+    try:
+        return await historyWriter.copy(userid,summary_id,cache_key,wait)
 
-        else:
-            data= file.read().decode('utf-8')
-            response = llmService(user_id,data,'txt')
-            print("text summary",response)
-            insertLLMSummary(user_id,data,response,file_type)
-            return response
-        
     except Exception as e:
-        print("Exception:",e)
-        return {"error",e}
-    
+        logger.exception("asyncCopyCachedSummary failed")
+
+def encodeHistoryCursor(createdAt,summaryId):
+    raw=f"{createdAt.isoformat()}|{summaryId}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decodeHistoryCursor(cursor):
+    raw=base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+    createdAt,summaryId=raw.split('|')
+    return datetime.fromisoformat(createdAt),str(uuid.UUID(summaryId))
+
+
+def historyContents(rows):
+    # rows end with (content, codec, data)
+    return [storedContent(*row[-3:]) for row in rows]
+
 
-def pdfService(user_id,file,file_type):
+async def asyncFetchHistoryService(userId,limit=config.HISTORY_PAGE_SIZE,cursor=None,includeContent=False):
+    """One page of the user's history, newest first.
+
+    Keyset pagination on (created_at, summary_id) served by
+    summaryhistory_user_created_idx; content is only fetched from the
+    blob table and decompressed when asked for. Pass the returned
+    next_cursor to get the following page.
+    """
     try:
-       print("Enter pdf service")
-       content=file.read()
-       pdf=fitz.open(stream=content,filetype='pdf')
-       txt=''
-       for page in pdf:
-           print("number: ",page.number)
-           txt+=page.get_text()
-       print("pdf content: ",txt)
-
-       response = llmService(user_id,txt,'pdf')
-       insertLLMSummary(user_id,txt,response,file_type)
-       return response
+        limit=max(1,min(limit,config.HISTORY_PAGE_MAX))
+        columns=["summary_id","filetype","llmsummary","created_at","prompt_tokens","completion_tokens"]
+        selected=[f"h.{column}" for column in columns]
+        source="summaryhistory h"
+        if includeContent:
+            selected+=["h.content","b.codec","b.data"]
+            source+=" left join contentBlob b on b.content_hash=h.content_hash"
+
+        query=f"Select {','.join(selected)} from {source} where h.user_id=%s"
+        values=[str(userId)]
+        if cursor:
+            query+=" and (h.created_at,h.summary_id) < (%s,%s)"
+            values.extend(decodeHistoryCursor(cursor))
+        query+=" order by h.created_at desc,h.summary_id desc limit %s"
+        values.append(limit+1)
+
+        with metricsRegistry.span('db_history'):
+            async with asyncPostgresDb() as pg:
+                rows=await pg.showData(query,tuple(values))
+        if not isinstance(rows,list):
+            return rows
+
+        items=[dict(zip(columns,row)) for row in rows[:limit]]
+        if includeContent:
+            contents=await runBlocking(historyContents,rows[:limit])
+            for item,content in zip(items,contents):
+                item["content"]=content
+        nextCursor=None
+        if len(rows)>limit:
+            last=items[-1]
+            nextCursor=encodeHistoryCursor(last["created_at"],last["summary_id"])
+        return {"items":items,"next_cursor":nextCursor}
 
     except Exception as e:
-        print("Exception",e)
-        return {'error': e}
-    
+        logger.exception("asyncFetchHistoryService failed")
+        return {"Exception":e}
+
+
+def encodeSearchCursor(rank,createdAt,summaryId):
+    raw=f"{rank!r}|{createdAt.isoformat()}|{summaryId}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decodeSearchCursor(cursor):
+    raw=base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+    rank,createdAt,summaryId=raw.split('|')
+    return float(rank),datetime.fromisoformat(createdAt),str(uuid.UUID(summaryId))
+
 
-def docService(userid,file,file_type):
+async def asyncSearchHistoryService(userId,text,limit=config.SEARCH_PAGE_SIZE,cursor=None,inContent=False):
+    """Ranked full-text search over the user's summaries.
+
+    text is parsed with websearch_to_tsquery, so quotes, `or` and `-word`
+    work. Matches come from the (user_id, search_vector) GIN index; with
+    inContent the extracted text in contentBlob is searched as well, at
+    half weight. Results are ordered by rank, newest first on ties, and
+    paged with next_cursor like /getHistory.
+    """
     try:
-        print("Enter document service")
-        docRead=Document(BytesIO(file.read()))
-        content = ''.join([para.text for para in docRead.paragraphs])
-        response = llmService(userid,content,'docx')
-        insertLLMSummary(userid,content,response,file_type)
-        return response
+        limit=max(1,min(limit,config.HISTORY_PAGE_MAX))
+        language=config.SEARCH_LANGUAGE
+        values=[text,str(userId)]
+        if inContent:
+            # uncorrelated, so the blob GIN index is probed once per query
+            matches=f"""(h.search_vector @@ q or h.content_hash in
+                           (Select content_hash from contentBlob where search_vector @@ websearch_to_tsquery('{language}',%s)))"""
+            values.append(text)
+            rank="ts_rank_cd(h.search_vector,q,32)+0.5*coalesce(ts_rank_cd(b.search_vector,q,32),0)"
+            source="summaryhistory h left join contentBlob b on b.content_hash=h.content_hash"
+        else:
+            matches="h.search_vector @@ q"
+            rank="ts_rank_cd(h.search_vector,q,32)"
+            source="summaryhistory h"
+
+        after=""
+        if cursor:
+            after="where (r.rank,r.created_at,r.summary_id) < (%s,%s,%s)"
+            values.extend(decodeSearchCursor(cursor))
+        values.append(limit+1)
+
+        # the headline is only built for the rows on this page
+        query=f"""Select p.summary_id,p.filetype,p.llmsummary,p.created_at,p.rank,
+                         ts_headline('{language}',p.llmsummary,p.q,'MaxFragments=2,MaxWords=20,MinWords=5')
+                  from (Select r.* from
+                          (Select h.summary_id,h.filetype,h.llmsummary,h.created_at,{rank} as rank,q
+                           from {source}, websearch_to_tsquery('{language}',%s) q
+                           where h.user_id=%s and {matches}) r
+                        {after}
+                        order by r.rank desc,r.created_at desc,r.summary_id desc limit %s) p
+                  order by p.rank desc,p.created_at desc,p.summary_id desc"""
+
+        with metricsRegistry.span('db_search'):
+            async with asyncPostgresDb() as pg:
+                rows=await pg.showData(query,tuple(values))
+        if not isinstance(rows,list):
+            return rows
+
+        columns=["summary_id","filetype","llmsummary","created_at","rank","snippet"]
+        items=[dict(zip(columns,row)) for row in rows[:limit]]
+        nextCursor=None
+        if len(rows)>limit:
+            last=items[-1]
+            nextCursor=encodeSearchCursor(last["rank"],last["created_at"],last["summary_id"])
+        return {"items":items,"next_cursor":nextCursor}
+
     except Exception as e:
-        print("Exception: ",e)
-        return {"error":e}
+        logger.exception("asyncSearchHistoryService failed")
+        return {"Exception":e}
 
 
-def llmService(userid,content,file_type):
+async def asyncSemanticSearchService(userId,text,k=config.VECTOR_TOP_K):
+    """Summaries and content chunks of the user's history closest in
+    meaning to text, best first."""
     try:
-        model = ChatOllama(model='llama3.2:latest',temperature=0.3)
-
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", f"""
-Role:             
--You are a professional English teacher with over 10 years of experience and strong summarization skills.
-
-Objective:
--Your job is to clearly and concisely summarize content based on its file type.
-
-File Type: 
--{file_type if file_type else 'pdf or docx or csv or xlsx or txt file'}
-
-Instructions:
-- You must always produce a clear and meaningful summary based on the input — even if the content is informal, unstructured, or minimal.
-- Do not generate SQL queries, programming code, shell commands, or advice.
-- Do not include anything that wasn’t directly found or implied in the original content.
-- Avoid hallucinating facts or adding hypothetical content.
-
-Formatting:
-        - Format your output using basic Markdown syntax that will be converted to a Word document.
-        - Use only the following Markdown elements:
-        - #, ##, ### for headings and subheadings
-        - - for bullet points
-        - **bold text** to emphasize key terms or sections
-        - Do not use any other Markdown (like links, tables, or images).
-        - Keep the summary clear and concise, following this structure:
-            - One main heading for the document title
-            - Section headings (## or ###) to group topics
-            - Bullet points under each section with optional bold keywords
-
-"""),
-            ("user", "{content}")
-        ])
-
-        chain = prompt | model
-        response = chain.invoke({"content": content})
-        
-        docxFilePath=convertSummaryToDocx(str(userid),response.content)
-        pdfFilePath=f"{userid}_summary_pdf.pdf"
-        convertSummaryToPdf(docxFilePath,pdfFilePath)
-        print("LLm response:",response)
-        return response.content
+        k=max(1,min(k,config.HISTORY_PAGE_MAX))
+        hits=(await vectorIndex.search(userId,[text],k))[0]
+        return {"items":hits}
 
     except Exception as e:
-        print("Exception: ",e)
+        logger.exception("asyncSemanticSearchService failed")
         return {"error":e}
-    
 
-def insertLLMSummary(userid,content,llmresponse,file_type):
+
+async def runBlocking(func,*args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blockingExecutor,func,*args)
+
+
+def summaryPages(file_type,page_num,page_range):
+    # page window for the cache key; None means the whole document
+    pages = pageWindow(page_num,page_range) if file_type=='pdf' else None
+    return None if pages==(0,None) else pages
+
+
+async def asyncSummarize(upload,file_type,page_num=None,page_range=None,slots=None):
+    """Cache lookup, extraction and model call for one upload.
+
+    Returns (summary, text, cache_key, cached, usage); text is None for
+    cache hits and summary is an error dict when the model call failed.
+    Extraction is bounded by blockingExecutor, model calls by slots. New
+    summaries reach the cache when historyWriter commits their row.
+    """
+    cacheKey = summaryCacheKey(upload.hasher,file_type,config.OLLAMA_MODEL,PROMPT_VERSION,summaryPages(file_type,page_num,page_range))
+    with metricsRegistry.span('cache_lookup',file_type):
+        cached = await summaryCacheStore.lookup(cacheKey)
+    if cached is not None:
+        return cached,None,cacheKey,True,emptyUsage()
+
+    with metricsRegistry.span('extract',file_type):
+        text,promptType = await runBlocking(extractContent,upload,file_type,page_num,page_range)
+    usage = emptyUsage()
+    slots = slots or summarySlots
+    with metricsRegistry.span('slot_wait',file_type):
+        await slots.acquire()
     try:
-        query="""Insert into summaryHistory(fileType,content,llmSummary,user_id)
-                 values(%s,%s,%s,%s)"""
-        values=(file_type,content,llmresponse,str(userid))
-        pg=postgresDb()
-        result=pg.insertData(query,values)
-        print("Result: ",result)
+        response = await asyncLlmService(None,text,promptType,usage)
+    finally:
+        slots.release()
+    return response,text,cacheKey,False,usage
+
+
+async def asyncSummaryService(content,file_type,user_id,page_num=None,page_range=None,summary_id=None,durable=False):
+    """Summarizes one upload; takes the upload bytes or a spooledUpload.
+
+    At most MAX_CONCURRENT_SUMMARIES model calls run at once, the rest wait
+    for a slot. Cache hits never reach Ollama. The rendered docx/pdf are
+    kept in artifactStore under summary_id. The history row goes through
+    historyWriter; durable=True returns only once it is committed, and
+    returns the write error instead of the summary if the commit failed.
+    """
+    try:
+        with metricsRegistry.span('total',file_type):
+            summary_id = summary_id or uuid.uuid4()
+            response,text,cacheKey,cached,usage = await asyncSummarize(asUpload(content),file_type,page_num,page_range)
+            if isinstance(response,dict):
+                return response
+
+            await storeSummaryArtifacts(summary_id,user_id,response,file_type)
+            if cached:
+                stored = await asyncCopyCachedSummary(user_id,cacheKey,summary_id,durable)
+            else:
+                stored = await asyncInsertLLMSummary(user_id,text,response,file_type,cacheKey,summary_id,usage,durable)
+            if durable and (stored is None or stored.get('error')):
+                return {"error":stored.get('error') if stored else 'history row was not saved'}
+            return response
 
+    except pageOutOfRange as e:
+        return {"error":str(e),"status code":400}
     except Exception as e:
-        print("Exception",e)
+        logger.exception("asyncSummaryService failed")
+        return {"error":e}
+
 
+async def asyncBatchSummaryService(files,user_id):
+    """Summarizes many uploads concurrently, yielding one result per file
+    in completion order.
+
+    files is a list of (file name, file type, spooledUpload). Model calls
+    are capped at BATCH_CONCURRENCY; all history rows are written in a
+    single transaction once every file has finished, then a final
+    {"done": true} result reports how many were saved.
+    """
+    slots = asyncio.Semaphore(config.BATCH_CONCURRENCY)
+
+    async def summarizeOne(index,name,file_type,upload):
+        summary_id = uuid.uuid4()
+        result = {"index":index,"file":name}
+        try:
+            response,text,cacheKey,cached,usage = await asyncSummarize(upload,file_type,slots=slots)
+        except Exception as e:
+            response,text,cacheKey,cached,usage = {"error":e},None,None,False,None
+        if isinstance(response,dict):
+            result["error"] = str(response.get("error"))
+            return result,None,None
+
+        await storeSummaryArtifacts(summary_id,user_id,response,file_type)
+        result.update({"summary_id":str(summary_id),"data":response,"cached":cached,**usage})
+        if cached:
+            return result,None,(str(user_id),str(summary_id),cacheKey)
+        return result,summaryRow(user_id,text,response,file_type,cacheKey,summary_id,usage),None
+
+    tasks = [asyncio.create_task(summarizeOne(index,name,file_type,upload))
+             for index,(name,file_type,upload) in enumerate(files)]
+    rows = []
+    copies = []
+    try:
+        for finished in asyncio.as_completed(tasks):
+            result,row,copy = await finished
+            if row:
+                rows.append(row)
+            if copy:
+                copies.append(copy)
+            yield result
+
+        saved = await asyncInsertSummaryBatch(rows,copies)
+        yield {"done":True,"files":len(files),"saved":saved}
     finally:
-        pg.disconnect()
+        for task in tasks:
+            task.cancel()
 
 
-def convertSummaryToPdf(input_path,output_dir):
-    try:
-        if not os.path.exists(input_path):
-            print("There is not path for document. So I can't convert docx to pdf")
-            return
+async def asyncInsertSummaryBatch(rows,copies):
+    """Writes fresh summaries and cache-hit copies in one transaction."""
+    if not rows and not copies:
+        return 0
+    result = await historyWriter.writeBatch(rows,copies)
+    if result.get('error'):
+        return 0
+    return len(rows)+len(copies)
 
-        # if output_dir and not os.path.exists(output_dir):
-        #     os.makedirs(output_dir)
 
-        convert(input_path)
-        
-        print("✅ Summary converted document to PDF successfully.")
+async def asyncLlmService(userid,content,file_type,usage=None):
+    try:
+        chain = summaryChain(file_type)
+        condensed = await asyncCondenseContent(content,file_type,usage)
+        with metricsRegistry.span('llm_reduce',file_type):
+            response = await chain.ainvoke({"content": condensed})
+        addUsage(usage,response,summaryPromptTokens(condensed,file_type))
+        metricsRegistry.recordUsage(file_type,usage)
+        return response.content
+
     except Exception as e:
-        print("Exception:",e)
+        logger.exception("asyncLlmService failed")
+        return {"error":e}
+
+
+def sseEvent(event,data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 
-def convertSummaryToDocx(userId,response):
+async def asyncSummaryStream(content,file_type,user_id,page_num=None,page_range=None,summary_id=None):
+    """Streams a summary as server-sent events.
+
+    Emits `token` events with partial Markdown while the model generates,
+    then renders the docx/pdf and writes history before the final `done`
+    event. Cache hits are sent as a single `token` event.
+    """
     try:
-        doc = Document()
-
-        doc.add_heading("Summary", level=1)
-
-        for line in response.splitlines():
-            line = line.strip()
-
-            if line.startswith("### "):  # H3
-                doc.add_heading(line[4:].strip(), level=3)
-            elif line.startswith("## "):  # H2
-                doc.add_heading(line[3:].strip(), level=2)
-            elif line.startswith("# "):   # H1
-                doc.add_heading(line[2:].strip(), level=1)
-            elif line.startswith("- "):   # Bullet point
-                clean_line = line[2:].strip()
-
-                if "**" in clean_line:
-                    parts = clean_line.split("**")
-                    paragraph = doc.add_paragraph(style="List Bullet")
-                    for i, part in enumerate(parts):
-                        if i % 2 == 1:
-                            run = paragraph.add_run(part)
-                            run.bold = True
-                        else:
-                            paragraph.add_run(part)
-                else:
-                    doc.add_paragraph(clean_line, style="List Bullet")
-
-            elif line:
-                paragraph = doc.add_paragraph()
-
-                if "**" in line:
-                    parts = line.split("**")
-                    for i, part in enumerate(parts):
-                        if i % 2 == 1:
-                            run = paragraph.add_run(part)
-                            run.bold = True
-                        else:
-                            paragraph.add_run(part)
-                else:
-                    paragraph.add_run(line)
-        output_path = f"{userId}_summary.docx"
-        doc.save(output_path)
-        print("✅ Summary converted to .docx successfully.")
-        return output_path
+        summary_id = summary_id or uuid.uuid4()
+        upload = asUpload(content)
+        cacheKey = summaryCacheKey(upload.hasher,file_type,config.OLLAMA_MODEL,PROMPT_VERSION,summaryPages(file_type,page_num,page_range))
+        with metricsRegistry.span('cache_lookup',file_type):
+            cached = await summaryCacheStore.lookup(cacheKey)
+        if cached is not None:
+            yield sseEvent('token',{"delta":cached})
+            await storeSummaryArtifacts(summary_id,user_id,cached,file_type)
+            await asyncCopyCachedSummary(user_id,cacheKey,summary_id)
+            yield sseEvent('done',{"cached":True,"summary_id":str(summary_id)})
+            return
 
+        # extract before taking a model slot, as asyncSummarize does, so a
+        # slow parse never holds up other users' model calls
+        with metricsRegistry.span('extract',file_type):
+            text,promptType = await runBlocking(extractContent,upload,file_type,page_num,page_range)
+        with metricsRegistry.span('slot_wait',file_type):
+            await summarySlots.acquire()
+        try:
+            chain = summaryChain(promptType)
+
+            started = time.perf_counter()
+            firstToken = None
+            parts = []
+            usage = emptyUsage()
+            final = None
+            condensed = await asyncCondenseContent(text,promptType,usage)
+            with metricsRegistry.span('llm_stream',promptType):
+                async for chunk in chain.astream({"content": condensed}):
+                    final = chunk if final is None else final+chunk
+                    if not chunk.content:
+                        continue
+                    if firstToken is None:
+                        firstToken = time.perf_counter()-started
+                        metricsRegistry.stageSeconds.observe(firstToken,'llm_first_token',fileTypeLabel(promptType))
+                        logger.info("summary %s time to first token: %.0f ms",summary_id,firstToken*1000)
+                    parts.append(chunk.content)
+                    yield sseEvent('token',{"delta":chunk.content})
+            elapsed = time.perf_counter()-started
+
+            response = ''.join(parts)
+            if final is not None:
+                addUsage(usage,final,summaryPromptTokens(condensed,promptType))
+            metricsRegistry.recordUsage(promptType,usage)
+            await storeSummaryArtifacts(summary_id,user_id,response,file_type)
+            await asyncInsertLLMSummary(user_id,text,response,file_type,cacheKey,summary_id,usage)
+        finally:
+            summarySlots.release()
+
+        yield sseEvent('done',{"cached":False,
+                               "summary_id":str(summary_id),
+                               **usage,
+                               "ttft_ms":round(firstToken*1000) if firstToken is not None else None,
+                               "total_ms":round(elapsed*1000)})
+
+    except pageOutOfRange as e:
+        yield sseEvent('error',{"error":str(e),"status code":400})
     except Exception as e:
-        print("Exception: ",e)
+        logger.exception("asyncSummaryStream failed")
+        yield sseEvent('error',{"error":str(e)})
 
 
-def fetchHistoryService(userId):
+async def asyncInsertLLMSummary(userid,content,llmresponse,file_type,cache_key=None,summary_id=None,usage=None,wait=False):
     try:
-        query="Select filetype,content,llmsummary from summaryhistory where user_id=%s"
-        pg=postgresDb()
-        result=pg.showData(query,(str(userId),))
-        print("history result: ",result)
-        return result
+        values=summaryRow(userid,content,llmresponse,file_type,cache_key,summary_id,usage)
+        return await historyWriter.write(values,wait)
 
     except Exception as e:
-        print("Exception",e)
-        return {"Exception":e}
-    
-    finally:
-        pg.disconnect()
+        logger.exception("asyncInsertLLMSummary failed")
+
+
+async def asyncSummaryArtifact(summary_id,userid,fmt):
+    """Returns the rendered summary file, regenerating it from the history
+    row on a cache miss. None if the summary does not belong to the user."""
+    cached = await runBlocking(artifactStore.get,summary_id,fmt)
+    if cached is not None:
+        owner,data = cached
+        return data if owner==str(userid) else None
+
+    summary = await asyncStoredSummary(summary_id,userid)
+    if summary is None:
+        return None
+
+    artifacts = await storeSummaryArtifacts(summary_id,userid,summary)
+    return artifacts[fmt]
+
+
+async def asyncStoredSummary(summary_id,userid):
+    """The committed summary for summary_id if it belongs to the user, else None."""
+    query="Select llmsummary from summaryhistory where summary_id=%s and user_id=%s"
+    async with asyncPostgresDb() as pg:
+        rows=await pg.showData(query,(str(summary_id),str(userid)))
+    if not isinstance(rows,list) or not rows:
+        return None
+    return rows[0][0]
 
 
 # pdf, docx -> read, convert bytesIO
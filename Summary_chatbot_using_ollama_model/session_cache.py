@@ -0,0 +1,84 @@
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime,timezone
+from db_connection import asyncPostgresDb
+import config
+
+
+def tokenHash(token):
+    # only a hash of the token is stored, so a leaked table is not a login
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class sessionCache:
+    """Bearer-token sessions with an in-process TTL/LRU cache.
+
+    Tokens are persisted in userSession so every worker can validate them,
+    but a hit in the cache costs only a dictionary lookup. Cached entries
+    live at most SESSION_CACHE_TTL seconds, which bounds how long a token
+    revoked by another worker is still accepted here.
+    """
+
+    def __init__(self,maxEntries=config.SESSION_CACHE_SIZE,ttl=config.SESSION_CACHE_TTL):
+        self.maxEntries=maxEntries
+        self.ttl=ttl
+        self.entries=OrderedDict()
+        self.lock=threading.Lock()
+        self.hits=0
+        self.misses=0
+
+    def remember(self,key,userId,expiresAt):
+        with self.lock:
+            self.entries[key]=(userId,min(expiresAt,time.time()+self.ttl))
+            self.entries.move_to_end(key)
+            while len(self.entries)>self.maxEntries:
+                self.entries.popitem(last=False)
+
+    async def issue(self,userId):
+        token=secrets.token_urlsafe(32)
+        expiresAt=time.time()+config.SESSION_TTL
+        query="Insert into userSession(token_hash,user_id,expires_at) values(%s,%s,%s)"
+        async with asyncPostgresDb() as pg:
+            result=await pg.insertData(query,(tokenHash(token),str(userId),datetime.fromtimestamp(expiresAt,timezone.utc)))
+        if result.get('error'):
+            raise RuntimeError(result['error'])
+        self.remember(tokenHash(token),str(userId),expiresAt)
+        return token,expiresAt
+
+    async def validate(self,token):
+        """Returns the user id for a live token, otherwise None."""
+        key=tokenHash(token)
+        with self.lock:
+            entry=self.entries.get(key)
+            if entry and entry[1]>time.time():
+                self.entries.move_to_end(key)
+                self.hits+=1
+                return entry[0]
+            self.entries.pop(key,None)
+            self.misses+=1
+
+        query="Select user_id,expires_at from userSession where token_hash=%s and expires_at>now()"
+        async with asyncPostgresDb() as pg:
+            rows=await pg.showData(query,(key,))
+        if not isinstance(rows,list) or not rows:
+            return None
+        userId,expiresAt=rows[0]
+        self.remember(key,str(userId),expiresAt.timestamp())
+        return str(userId)
+
+    async def revoke(self,token):
+        key=tokenHash(token)
+        with self.lock:
+            self.entries.pop(key,None)
+        async with asyncPostgresDb() as pg:
+            return await pg.deleteData("Delete from userSession where token_hash=%s",(key,))
+
+    def stats(self):
+        with self.lock:
+            return {"entries":len(self.entries),"max_entries":self.maxEntries,"hits":self.hits,"misses":self.misses}
+
+
+sessionStore=sessionCache()
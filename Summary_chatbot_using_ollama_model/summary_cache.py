@@ -0,0 +1,91 @@
+import logging
+import threading
+from collections import OrderedDict
+from db_connection import asyncPostgresDb
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def summaryCacheKey(contentHash,file_type,model,promptVersion,pages=None):
+    """contentHash is a sha256 object already fed with the upload bytes."""
+    digest=contentHash.copy()
+    parts=[file_type,model,promptVersion]
+    if pages is not None:
+        parts.append(pages)
+    for part in parts:
+        digest.update(b'\0')
+        digest.update(str(part).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class summaryCache:
+    """Two-tier summary cache: an in-process LRU in front of summaryHistory.
+
+    Keys come from summaryCacheKey, so a re-upload of identical bytes with
+    the same model and prompt version is answered without calling Ollama.
+    """
+
+    def __init__(self,maxEntries=config.SUMMARY_CACHE_SIZE):
+        self.maxEntries=maxEntries
+        self.entries=OrderedDict()
+        self.lock=threading.Lock()
+        self.memoryHits=0
+        self.dbHits=0
+        self.misses=0
+
+    def get(self,key):
+        with self.lock:
+            summary=self.entries.get(key)
+            if summary is not None:
+                self.entries.move_to_end(key)
+            return summary
+
+    def put(self,key,summary):
+        if self.maxEntries<=0:
+            return
+        with self.lock:
+            self.entries[key]=summary
+            self.entries.move_to_end(key)
+            while len(self.entries)>self.maxEntries:
+                self.entries.popitem(last=False)
+
+    async def lookup(self,key):
+        summary=self.get(key)
+        if summary is not None:
+            with self.lock:
+                self.memoryHits+=1
+            return summary
+
+        query="Select llmsummary from summaryhistory where cache_key=%s limit 1"
+        try:
+            async with asyncPostgresDb() as pg:
+                rows=await pg.showData(query,(key,))
+        except Exception as e:
+            logger.warning("Summary cache lookup failed: %s",e)
+            rows=None
+
+        if isinstance(rows,list) and rows:
+            summary=rows[0][0]
+            self.put(key,summary)
+            with self.lock:
+                self.dbHits+=1
+            return summary
+
+        with self.lock:
+            self.misses+=1
+        return None
+
+    def stats(self):
+        with self.lock:
+            hits=self.memoryHits+self.dbHits
+            total=hits+self.misses
+            return {"memory_hits":self.memoryHits,
+                    "db_hits":self.dbHits,
+                    "misses":self.misses,
+                    "hit_ratio":round(hits/total,4) if total else 0.0,
+                    "entries":len(self.entries),
+                    "max_entries":self.maxEntries}
+
+
+summaryCacheStore=summaryCache()
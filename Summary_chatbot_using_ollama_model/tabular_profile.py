@@ -0,0 +1,163 @@
+from collections import Counter
+from io import BytesIO
+import numpy as np
+import pandas as pd
+import config
+
+
+class tableProfile:
+    """Streaming profile of a table, built one pandas chunk at a time.
+
+    Keeps only running aggregates, capped category counters and a
+    fixed-size uniform row sample, so memory does not grow with the
+    number of rows.
+    """
+
+    def __init__(self,sampleRows=config.TABULAR_SAMPLE_ROWS,topK=config.TABULAR_TOP_K):
+        self.sampleRows=sampleRows
+        self.topK=topK
+        self.maxTracked=max(topK*20,1000)
+        self.rows=0
+        self.columns=[]
+        self.dtypes={}
+        self.nulls=Counter()
+        self.numeric={}
+        self.numericValues={}
+        self.categories={}
+        self.pruned=set()
+        self.sample=None
+        self.sampleKeys=np.empty(0)
+        self.random=np.random.default_rng(0)
+
+    def add(self,chunk):
+        if not self.columns:
+            self.columns=[str(column) for column in chunk.columns]
+        chunk.columns=self.columns
+        self.rows+=len(chunk)
+        self.nulls.update(chunk.isna().sum().to_dict())
+
+        for column in self.columns:
+            series=chunk[column]
+            kind='numeric' if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series) else 'text'
+            if self.dtypes.get(column,(kind,))[0]!=kind:
+                kind='text'
+            self.dtypes[column]=(kind,str(series.dtype))
+
+            if kind=='numeric' and column not in self.categories:
+                values=series.dropna()
+                if values.empty:
+                    continue
+                self.countNumericValues(column,values)
+                values=values.astype('float64')
+                stats=self.numeric.setdefault(column,{"count":0,"sum":0.0,"sumsq":0.0,"min":np.inf,"max":-np.inf})
+                stats["count"]+=len(values)
+                stats["sum"]+=float(values.sum())
+                stats["sumsq"]+=float((values*values).sum())
+                stats["min"]=min(stats["min"],float(values.min()))
+                stats["max"]=max(stats["max"],float(values.max()))
+            else:
+                counts=self.categories.setdefault(column,Counter())
+                if column in self.numeric:
+                    self.foldNumeric(column,counts)
+                counts.update(series.dropna().astype(str).value_counts().to_dict())
+                if len(counts)>self.maxTracked:
+                    # approximate top-k: keep only the heaviest keys
+                    self.categories[column]=Counter(dict(counts.most_common(self.maxTracked//2)))
+                    self.pruned.add(column)
+
+        # bottom-k sampling on random keys gives a uniform sample in one pass
+        keys=self.random.random(len(chunk))
+        combined=chunk if self.sample is None else pd.concat([self.sample,chunk],ignore_index=True)
+        allKeys=np.concatenate([self.sampleKeys,keys])
+        keep=np.argsort(allKeys)[:self.sampleRows]
+        keep.sort()
+        self.sample=combined.iloc[keep].reset_index(drop=True)
+        self.sampleKeys=allKeys[keep]
+
+    def countNumericValues(self,column,values):
+        # exact value counts for low-cardinality numeric columns (codes,
+        # ids), kept in case the column turns to text in a later chunk;
+        # dropped for good once the column has too many distinct values
+        counts=self.numericValues.get(column,Counter() if column not in self.numeric else None)
+        if counts is None:
+            return
+        if values.iloc[:2*self.maxTracked].nunique()>self.maxTracked:
+            # already too many distinct values, without counting the chunk
+            self.numericValues[column]=None
+            return
+        counts.update(values.astype(str).value_counts().to_dict())
+        self.numericValues[column]=counts if len(counts)<=self.maxTracked else None
+
+    def foldNumeric(self,column,counts):
+        """Carries what was seen while the column still looked numeric into
+        its text counts: the exact values when they were tracked, else one
+        entry summarising the numeric rows."""
+        stats=self.numeric.pop(column)
+        earlier=self.numericValues.pop(column,None)
+        if earlier is not None:
+            counts.update(earlier)
+        else:
+            counts[f"<{stats['count']} numeric values from {stats['min']:g} to {stats['max']:g}>"]+=stats["count"]
+            self.pruned.add(column)
+
+    def render(self,maxChars=config.TABULAR_MAX_PROMPT_CHARS):
+        lines=[f"Table profile: {self.rows} rows x {len(self.columns)} columns",""]
+        lines.append("Columns:")
+        for column in self.columns:
+            kind,dtype=self.dtypes.get(column,('text','object'))
+            line=f"- {column} ({dtype}), nulls: {int(self.nulls.get(column,0))}"
+            if column in self.numeric:
+                stats=self.numeric[column]
+                mean=stats["sum"]/stats["count"]
+                variance=max(stats["sumsq"]/stats["count"]-mean*mean,0.0)
+                line+=f", min: {stats['min']:g}, max: {stats['max']:g}, mean: {mean:g}, std: {variance**0.5:g}"
+            elif column in self.categories:
+                counts=self.categories[column]
+                top=", ".join(f"{value} ({count})" for value,count in counts.most_common(self.topK))
+                line+=f", distinct: {len(counts)}{'+' if column in self.pruned else ''}, top: {top}"
+            lines.append(line)
+
+        if self.sample is not None and len(self.sample):
+            label="All rows" if len(self.sample)==self.rows else f"Sample of {len(self.sample)} rows"
+            lines.extend(["",f"{label}:",self.sample.to_csv(index=False,float_format='%.6g')])
+
+        text="\n".join(lines)
+        if len(text)>maxChars:
+            text=text[:maxChars]+"\n[profile truncated]"
+        return text
+
+
+def profileCsv(source):
+    """source is a binary file object (or bytes)."""
+    if isinstance(source,bytes):
+        source=BytesIO(source)
+    profile=tableProfile()
+    for chunk in pd.read_csv(source,chunksize=config.TABULAR_CHUNK_ROWS):
+        profile.add(chunk)
+    return profile.render()
+
+
+def profileXlsx(source):
+    from openpyxl import load_workbook
+
+    if isinstance(source,bytes):
+        source=BytesIO(source)
+    profile=tableProfile()
+    workbook=load_workbook(source,read_only=True,data_only=True)
+    try:
+        rows=workbook.worksheets[0].iter_rows(values_only=True)
+        header=next(rows,None)
+        if header is None:
+            return profile.render()
+        header=[str(name) if name is not None else f"Unnamed: {i}" for i,name in enumerate(header)]
+        batch=[]
+        for row in rows:
+            batch.append(row)
+            if len(batch)>=config.TABULAR_CHUNK_ROWS:
+                profile.add(pd.DataFrame(batch,columns=header).infer_objects())
+                batch=[]
+        if batch:
+            profile.add(pd.DataFrame(batch,columns=header).infer_objects())
+    finally:
+        workbook.close()
+    return profile.render()
@@ -0,0 +1,99 @@
+import threading
+from chunking import countTokens
+from prompts import summaryPrompt,chunkPrompt
+import config
+
+# chat templates add a few tokens of role/header markup per message
+messageOverheadTokens = 4
+
+promptBuilders = {'summary':summaryPrompt,'chunk':chunkPrompt}
+
+
+def emptyUsage():
+    return {"prompt_tokens":0,"completion_tokens":0}
+
+
+def addUsage(usage,message,promptTokens=0):
+    """Adds one model response to usage. Uses Ollama's own counts from
+    usage_metadata and falls back to estimates when they are missing."""
+    if usage is None:
+        return usage
+    meta = getattr(message,'usage_metadata',None)
+    if meta:
+        usage["prompt_tokens"]+=meta.get('input_tokens',0)
+        usage["completion_tokens"]+=meta.get('output_tokens',0)
+    else:
+        usage["prompt_tokens"]+=promptTokens
+        usage["completion_tokens"]+=countTokens(message.content or '')
+    return usage
+
+
+class tokenBudget:
+    """Fits prompts into the model's context window.
+
+    plan() counts the system template plus the content and picks a
+    strategy before the model is called: 'pass' when it fits, 'trim'
+    when it is over by at most BUDGET_TRIM_TOKENS (the tail is cut), and
+    'chunked' otherwise (map-reduce in asyncCondenseContent). The content
+    budget is the context window less the template and
+    COMPLETION_RESERVE_TOKENS, capped at CHUNKED_SUMMARY_THRESHOLD.
+    """
+
+    def __init__(self,contextTokens=None,reserveTokens=None,trimTokens=None):
+        self.contextTokens=contextTokens or config.CONTEXT_WINDOW_TOKENS
+        self.reserveTokens=config.COMPLETION_RESERVE_TOKENS if reserveTokens is None else reserveTokens
+        self.trimTokens=config.BUDGET_TRIM_TOKENS if trimTokens is None else trimTokens
+        self.lock=threading.Lock()
+        self.templates={}
+        self.strategies={'pass':0,'trim':0,'chunked':0}
+        self.trimmedTokens=0
+
+    def templateTokens(self,kind,file_type):
+        key=(kind,file_type)
+        tokens=self.templates.get(key)
+        if tokens is None:
+            messages=promptBuilders[kind](file_type).format_messages(content='',part=0,total=0)
+            tokens=sum(countTokens(message.content)+messageOverheadTokens for message in messages)
+            with self.lock:
+                self.templates[key]=tokens
+        return tokens
+
+    def contentBudget(self,file_type,kind='summary'):
+        available=self.contextTokens-self.reserveTokens-self.templateTokens(kind,file_type)
+        if kind=='summary':
+            available=min(available,config.CHUNKED_SUMMARY_THRESHOLD)
+        return max(available,1)
+
+    def plan(self,content,file_type):
+        budget=self.contentBudget(file_type)
+        contentTokens=countTokens(content)
+        if contentTokens<=budget:
+            strategy='pass'
+        elif contentTokens<=budget+self.trimTokens:
+            strategy='trim'
+        else:
+            strategy='chunked'
+        with self.lock:
+            self.strategies[strategy]+=1
+        return {"strategy":strategy,"budget":budget,"content_tokens":contentTokens,
+                "template_tokens":self.templateTokens('summary',file_type)}
+
+    def fit(self,content,budget):
+        """Cuts content down to budget tokens, at a word boundary when possible."""
+        if countTokens(content)<=budget:
+            return content
+        maxChars=budget*config.CHARS_PER_TOKEN
+        cut=content.rfind(' ',0,maxChars)
+        trimmed=content[:cut if cut>maxChars//2 else maxChars]
+        with self.lock:
+            self.trimmedTokens+=countTokens(content)-countTokens(trimmed)
+        return trimmed
+
+    def stats(self):
+        with self.lock:
+            return {"context_tokens":self.contextTokens,"reserve_tokens":self.reserveTokens,
+                    "trim_tokens":self.trimTokens,"strategies":dict(self.strategies),
+                    "trimmed_tokens":self.trimmedTokens}
+
+
+tokenBudgeter=tokenBudget()
@@ -0,0 +1,405 @@
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import resource
+import shutil
+import tempfile
+import threading
+import zipfile
+from io import BytesIO
+import starlette.formparsers
+import config
+
+readChunkBytes = 1024*1024
+
+# extractContent reads anything else as plain text
+fileTypes = ('pdf','docx','csv','xlsx','txt')
+
+
+class uploadTooLarge(Exception):
+    pass
+
+
+def uploadFileType(filename):
+    """The file type for an upload's name: one of fileTypes, 'zip', or
+    'txt' for anything unrecognised. Never the raw user extension, which
+    ends up in history rows and metric labels."""
+    extension=filename.rsplit('.',1)[-1].lower() if '.' in filename else ''
+    if extension in fileTypes or extension=='zip':
+        return extension
+    return 'txt'
+
+
+class spooledUpload:
+    """An uploaded file held once, either in memory or in a temp file.
+
+    Bodies up to UPLOAD_SPOOL_THRESHOLD stay as a single bytes object;
+    larger ones are written to a named temp file so parsers can open the
+    path or an mmap instead of another full copy. `hasher` is a sha256 of
+    the content, computed while spooling.
+    """
+
+    def __init__(self,data=None,path=None,size=0,hasher=None):
+        self.data=data
+        self.path=path
+        self.size=size
+        self.hasher=hasher
+
+    @classmethod
+    def fromBytes(cls,data):
+        return cls(data=data,size=len(data),hasher=hashlib.sha256(data))
+
+    @classmethod
+    def fromPath(cls,path):
+        hasher=hashlib.sha256()
+        size=0
+        with open(path,'rb') as source:
+            while chunk:=source.read(readChunkBytes):
+                hasher.update(chunk)
+                size+=len(chunk)
+        return cls(path=path,size=size,hasher=hasher)
+
+    @property
+    def memoryBytes(self):
+        return len(self.data) if self.data is not None else 0
+
+    def open(self):
+        """A fresh binary file object positioned at the start."""
+        if self.path:
+            return open(self.path,'rb')
+        # BytesIO shares the bytes object until it is written to
+        return BytesIO(self.data)
+
+    def view(self):
+        """Zero-copy buffer over the content (memoryview or read-only mmap);
+        use as a context manager."""
+        if self.path:
+            if self.size==0:
+                return memoryview(b'')
+            with open(self.path,'rb') as source:
+                return mmap.mmap(source.fileno(),0,access=mmap.ACCESS_READ)
+        return memoryview(self.data)
+
+    def moveTo(self,path):
+        """Persists the content at path and takes ownership of that file."""
+        if self.path:
+            shutil.move(self.path,path)
+        else:
+            with open(path,'wb') as target:
+                target.write(self.data)
+            self.data=None
+        self.path=path
+
+    def close(self):
+        self.data=None
+        if self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.path=None
+
+
+class uploadSpoolFile(tempfile.SpooledTemporaryFile):
+    """The spool Starlette writes each multipart file part into.
+
+    It hashes and counts bytes as they arrive and, past
+    UPLOAD_SPOOL_THRESHOLD, rolls over to a named file in
+    UPLOAD_SPOOL_DIR, so spoolUpload can take the file over instead of
+    copying the body a second time. A rolled-over file nobody adopted is
+    removed on close. It leans on private SpooledTemporaryFile attributes;
+    checkUploadSpooling verifies them at startup.
+    """
+
+    def __init__(self,max_size=0,**kwargs):
+        super().__init__(max_size=config.UPLOAD_SPOOL_THRESHOLD,**kwargs)
+        self.hasher=hashlib.sha256()
+        self.size=0
+        self.adopted=False
+
+    def write(self,data):
+        self.hasher.update(data)
+        self.size+=len(data)
+        return super().write(data)
+
+    def rollover(self):
+        if self._rolled:
+            return
+        memory=self._file
+        self._file=tempfile.NamedTemporaryFile(prefix='summary_upload_',dir=config.UPLOAD_SPOOL_DIR,delete=False)
+        del self._TemporaryFileArgs
+        position=memory.tell()
+        self._file.write(memory.getvalue())
+        self._file.seek(position,0)
+        self._rolled=True
+
+    def adopt(self):
+        """Hands the content over as a spooledUpload, without copying it to disk."""
+        self.adopted=True
+        if self._rolled:
+            self._file.flush()
+            return spooledUpload(path=self._file.name,size=self.size,hasher=self.hasher)
+        return spooledUpload(data=self._file.getvalue(),size=self.size,hasher=self.hasher)
+
+    def close(self):
+        path=self._file.name if self._rolled and not self.adopted else None
+        super().close()
+        if path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def checkUploadSpooling():
+    """Fails loudly if the tempfile or Starlette internals uploadSpoolFile
+    relies on are gone (pinned in requirements.txt: Python 3.11,
+    starlette 0.46)."""
+    if starlette.formparsers.__dict__.get('SpooledTemporaryFile') not in (tempfile.SpooledTemporaryFile,uploadSpoolFile):
+        raise RuntimeError("starlette.formparsers no longer spools uploads through tempfile.SpooledTemporaryFile; "
+                           "uploadSpoolFile cannot be installed")
+    if not hasattr(tempfile.SpooledTemporaryFile,'_check'):
+        raise RuntimeError("tempfile.SpooledTemporaryFile no longer rolls over through _check/rollover")
+    probe=uploadSpoolFile()
+    try:
+        missing=[name for name in ('_rolled','_file','_TemporaryFileArgs') if not hasattr(probe,name)]
+        if missing:
+            raise RuntimeError(f"tempfile.SpooledTemporaryFile lacks {', '.join(missing)}; uploadSpoolFile needs updating")
+        probe.write(b'probe')
+        probe.rollover()
+        if not probe._rolled or not os.path.exists(probe._file.name):
+            raise RuntimeError("uploadSpoolFile.rollover no longer moves the spool to a named file")
+    finally:
+        probe.close()
+
+
+def installUploadSpooling():
+    # FastAPI builds UploadFiles through starlette.formparsers
+    checkUploadSpooling()
+    starlette.formparsers.SpooledTemporaryFile=uploadSpoolFile
+
+
+def uploadLimit(scope):
+    """Byte cap for the request body of the upload routes, else None."""
+    if scope['type']!='http' or scope['method']!='POST' or not scope['path'].startswith('/summary'):
+        return None
+    return config.BATCH_MAX_BYTES if scope['path']=='/summary/batch' else config.MAX_UPLOAD_BYTES
+
+
+class uploadSizeLimit:
+    """ASGI middleware that enforces the upload cap while the body streams in.
+
+    A Content-Length over the limit is refused before anything is read;
+    otherwise received bytes are counted and the request is answered with
+    413 as soon as they pass the limit, which also covers chunked
+    requests. Whatever the app does with the aborted body is discarded.
+    """
+
+    def __init__(self,app):
+        self.app=app
+
+    async def __call__(self,scope,receive,send):
+        limit=uploadLimit(scope)
+        if limit is None:
+            return await self.app(scope,receive,send)
+        allowed=limit+config.UPLOAD_FORM_OVERHEAD_BYTES
+        length=dict(scope['headers']).get(b'content-length',b'')
+        if length.isdigit() and int(length)>allowed:
+            return await self.reject(send,limit)
+
+        received=0
+        rejected=False
+
+        async def limitedReceive():
+            nonlocal received,rejected
+            message=await receive()
+            if message['type']=='http.request':
+                received+=len(message.get('body',b''))
+                if received>allowed:
+                    if not rejected:
+                        rejected=True
+                        await self.reject(send,limit)
+                    raise uploadTooLarge(f"upload exceeds {limit} bytes")
+            return message
+
+        async def guardedSend(message):
+            if not rejected:
+                await send(message)
+
+        try:
+            await self.app(scope,limitedReceive,guardedSend)
+        except Exception:
+            if not rejected:
+                raise
+
+    async def reject(self,send,limit):
+        uploadStats.reject()
+        body=json.dumps({"data":f'File should be at most {limit} bytes','status code':413}).encode('utf-8')
+        await send({'type':'http.response.start','status':413,
+                    'headers':[(b'content-type',b'application/json'),(b'content-length',str(len(body)).encode('ascii'))]})
+        await send({'type':'http.response.body','body':body})
+
+
+def asUpload(content):
+    return content if isinstance(content,spooledUpload) else spooledUpload.fromBytes(content)
+
+
+class uploadSpooler:
+    """Builds a spooledUpload from chunks: hashes them, enforces maxBytes
+    and moves to a temp file once threshold is passed. Shared by the
+    async and blocking spool functions."""
+
+    def __init__(self,maxBytes,threshold):
+        self.maxBytes=maxBytes
+        self.threshold=threshold
+        self.hasher=hashlib.sha256()
+        self.parts=[]
+        self.size=0
+        self.target=None
+
+    def feed(self,chunk):
+        self.size+=len(chunk)
+        if self.size>self.maxBytes:
+            raise uploadTooLarge(f"upload exceeds {self.maxBytes} bytes")
+        self.hasher.update(chunk)
+        if self.target is None and self.size>self.threshold:
+            self.target=tempfile.NamedTemporaryFile(prefix='summary_upload_',dir=config.UPLOAD_SPOOL_DIR,delete=False)
+            self.target.writelines(self.parts)
+            self.parts=[]
+        if self.target is not None:
+            self.target.write(chunk)
+        else:
+            self.parts.append(chunk)
+
+    def finish(self):
+        if self.target is not None:
+            self.target.close()
+            return spooledUpload(path=self.target.name,size=self.size,hasher=self.hasher)
+        return spooledUpload(data=b''.join(self.parts),size=self.size,hasher=self.hasher)
+
+    def discard(self):
+        if self.target is not None:
+            self.target.close()
+            os.remove(self.target.name)
+
+
+async def spoolUpload(file,maxBytes=config.MAX_UPLOAD_BYTES,threshold=config.UPLOAD_SPOOL_THRESHOLD):
+    """A spooledUpload for a FastAPI UploadFile, raising uploadTooLarge
+    past maxBytes.
+
+    Files Starlette spooled through uploadSpoolFile are taken over as
+    they are; anything else is copied in fixed-size chunks."""
+    if isinstance(file.file,uploadSpoolFile):
+        if file.file.size>maxBytes:
+            raise uploadTooLarge(f"upload exceeds {maxBytes} bytes")
+        upload=await asyncio.to_thread(file.file.adopt)
+    else:
+        spooler=uploadSpooler(maxBytes,threshold)
+        try:
+            while chunk:=await file.read(readChunkBytes):
+                spooler.feed(chunk)
+        except BaseException:
+            spooler.discard()
+            raise
+        upload=spooler.finish()
+    uploadStats.record(upload)
+    return upload
+
+
+def spoolStream(source,maxBytes=config.MAX_UPLOAD_BYTES,threshold=config.UPLOAD_SPOOL_THRESHOLD):
+    """Blocking counterpart of spoolUpload for a binary file object."""
+    spooler=uploadSpooler(maxBytes,threshold)
+    try:
+        while chunk:=source.read(readChunkBytes):
+            spooler.feed(chunk)
+    except BaseException:
+        spooler.discard()
+        raise
+    return spooler.finish()
+
+
+def expandZip(upload,maxFiles=config.BATCH_MAX_FILES,maxBytes=config.BATCH_MAX_BYTES):
+    """Unpacks a zip upload into [(name, file_type, spooledUpload)].
+
+    Directories and macOS resource forks are skipped. Each member is
+    capped at MAX_UPLOAD_BYTES and the archive at maxFiles members and
+    maxBytes uncompressed, checked while reading rather than trusting
+    the zip headers.
+    """
+    files=[]
+    total=0
+    try:
+        with upload.open() as source, zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                name=info.filename
+                if info.is_dir() or name.startswith('__MACOSX/') or os.path.basename(name).startswith('._'):
+                    continue
+                if len(files)>=maxFiles:
+                    raise uploadTooLarge(f"archive has more than {maxFiles} files")
+                with archive.open(info) as member:
+                    spooled=spoolStream(member,min(config.MAX_UPLOAD_BYTES,maxBytes-total))
+                total+=spooled.size
+                uploadStats.record(spooled)
+                files.append((name,uploadFileType(name),spooled))
+    except BaseException:
+        for _,_,spooled in files:
+            spooled.close()
+        raise
+    return files
+
+
+def residentBytes():
+    """Current resident set size, or None where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+    except (OSError,ValueError,IndexError):
+        return None
+
+
+def peakResidentBytes():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024
+
+
+class uploadMetrics:
+    """Upload accounting: how many bodies were kept in memory versus on
+    disk and how many bytes each one held in memory. Process-wide RSS is
+    reported alongside, since per-request memory cannot be separated
+    from the rest of the process."""
+
+    def __init__(self):
+        self.lock=threading.Lock()
+        self.uploads=0
+        self.spooledToDisk=0
+        self.bytesTotal=0
+        self.lastMemoryBytes=0
+        self.peakMemoryBytes=0
+        self.rejected=0
+
+    def record(self,upload):
+        with self.lock:
+            self.uploads+=1
+            self.bytesTotal+=upload.size
+            self.spooledToDisk+=1 if upload.path else 0
+            self.lastMemoryBytes=upload.memoryBytes
+            self.peakMemoryBytes=max(self.peakMemoryBytes,upload.memoryBytes)
+
+    def reject(self):
+        with self.lock:
+            self.rejected+=1
+
+    def stats(self):
+        with self.lock:
+            return {"uploads":self.uploads,"spooled_to_disk":self.spooledToDisk,"rejected":self.rejected,
+                    "bytes_total":self.bytesTotal,
+                    "upload_memory_bytes_last":self.lastMemoryBytes,
+                    "upload_memory_bytes_peak":self.peakMemoryBytes,
+                    "process_rss_bytes":residentBytes(),
+                    "process_peak_rss_bytes":peakResidentBytes(),
+                    "max_upload_bytes":config.MAX_UPLOAD_BYTES}
+
+
+uploadStats=uploadMetrics()
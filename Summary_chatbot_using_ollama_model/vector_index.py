@@ -0,0 +1,437 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+import numpy as np
+from db_connection import asyncPostgresDb
+from chunking import splitByTokens
+from content_store import storedContent
+from model_registry import modelRegistry
+from metrics import metricsRegistry
+import config
+
+logger = logging.getLogger(__name__)
+
+vectorDtype = np.float16
+
+# rows whose text is not in hand: cache-hit copies and backfill
+loadRowsQuery = """Select h.user_id,h.summary_id,h.llmsummary,h.content,b.codec,b.data from summaryHistory h
+                   left join contentBlob b on b.content_hash=h.content_hash
+                   where h.summary_id = any(%s::uuid[])"""
+
+userSummaryIdsQuery = "Select summary_id from summaryHistory where user_id=%s and llmsummary is not null"
+
+
+def historyItems(rows=(),copies=()):
+    """(user_id, summary_id, summary, content) for committed history rows.
+
+    rows are service.summaryRow tuples; copies are the (user_id,
+    summary_id, cache_key) triples of cache hits, whose text is loaded
+    from summaryHistory when they are indexed.
+    """
+    items=[(row[3],row[5],row[2],row[1]) for row in rows if isinstance(row[2],str)]
+    items.extend((userId,summaryId,None,None) for userId,summaryId,_ in copies)
+    return items
+
+
+def unitRows(vectors):
+    vectors=np.asarray(vectors,dtype=np.float32)
+    norms=np.linalg.norm(vectors,axis=1,keepdims=True)
+    norms[norms==0]=1
+    return vectors/norms
+
+
+class userVectors:
+    """One user's vectors on disk, read through a memory map.
+
+    vectors.f16 holds unit-length float16 rows and only ever grows;
+    rows.jsonl has one [summary_id, kind, chunk, offset, length] line per
+    vector pointing into texts.txt. The files are appended in that order
+    (texts, vectors, rows), so a crash part way leaves them at different
+    lengths and load() trims back to the rows that are complete.
+    """
+
+    def __init__(self,path,model):
+        self.path=path
+        self.model=model
+        self.lock=threading.Lock()
+        self.load()
+
+    def file(self,name):
+        return os.path.join(self.path,name)
+
+    def load(self):
+        self.dim=None
+        self.rows=[]
+        self.summaryIds=set()
+        self.matrix=None
+        try:
+            with open(self.file('index.json')) as header:
+                info=json.load(header)
+        except (OSError,ValueError):
+            info={}
+        if info.get('model')!=self.model:
+            # vectors from another embedding model are not comparable
+            shutil.rmtree(self.path,ignore_errors=True)
+            return
+
+        self.dim=info['dim']
+        rows=[]
+        try:
+            with open(self.file('rows.jsonl')) as source:
+                for line in source:
+                    if not line.endswith('\n'):
+                        break
+                    rows.append(json.loads(line))
+        except FileNotFoundError:
+            pass
+        textBytes=self.size('texts.txt')
+        count=min(len(rows),self.size('vectors.f16')//self.rowBytes())
+        while count and rows[count-1][3]+rows[count-1][4]>textBytes:
+            count-=1
+        if count<len(rows) or self.size('vectors.f16')!=count*self.rowBytes():
+            logger.warning("Trimming vector index %s to %d complete rows",self.path,count)
+            with open(self.file('vectors.f16'),'ab') as vectors:
+                vectors.truncate(count*self.rowBytes())
+            with open(self.file('rows.jsonl'),'w') as target:
+                target.write(''.join(json.dumps(row)+'\n' for row in rows[:count]))
+        self.rows=rows[:count]
+        self.summaryIds={row[0] for row in self.rows}
+        self.remap()
+
+    def size(self,name):
+        try:
+            return os.path.getsize(self.file(name))
+        except OSError:
+            return 0
+
+    def rowBytes(self):
+        return self.dim*np.dtype(vectorDtype).itemsize
+
+    def remap(self):
+        count=len(self.rows)
+        self.matrix=np.memmap(self.file('vectors.f16'),dtype=vectorDtype,mode='r',shape=(count,self.dim)) if count else None
+
+    def refresh(self):
+        # another instance for the same user (after an LRU eviction) may have appended
+        if self.dim is not None and self.size('vectors.f16')!=len(self.rows)*self.rowBytes():
+            self.load()
+
+    def append(self,entries,vectors):
+        """Adds (summary_id, kind, chunk, text) entries with their vectors.
+        Summaries that are already indexed are skipped; returns the rows added."""
+        with self.lock:
+            self.refresh()
+            keep=[index for index,entry in enumerate(entries) if entry[0] not in self.summaryIds]
+            if not keep:
+                return 0
+            vectors=vectors[keep]
+            if self.dim is None:
+                os.makedirs(self.path,exist_ok=True)
+                self.dim=int(vectors.shape[1])
+                temp=self.file('index.json.tmp')
+                with open(temp,'w') as header:
+                    json.dump({"model":self.model,"dim":self.dim},header)
+                os.replace(temp,self.file('index.json'))
+            elif vectors.shape[1]!=self.dim:
+                raise ValueError(f"embedding has {vectors.shape[1]} dimensions, the index has {self.dim}")
+
+            offset=self.size('texts.txt')
+            rows=[]
+            texts=[]
+            for index in keep:
+                summaryId,kind,chunk,text=entries[index]
+                data=text.encode('utf-8')
+                rows.append([summaryId,kind,chunk,offset,len(data)])
+                texts.append(data)
+                offset+=len(data)
+            with open(self.file('texts.txt'),'ab') as target:
+                target.write(b''.join(texts))
+            with open(self.file('vectors.f16'),'ab') as target:
+                target.write(np.ascontiguousarray(vectors,dtype=vectorDtype).tobytes())
+            with open(self.file('rows.jsonl'),'a') as target:
+                target.write(''.join(json.dumps(row)+'\n' for row in rows))
+
+            self.rows.extend(rows)
+            self.summaryIds.update(row[0] for row in rows)
+            self.remap()
+            return len(rows)
+
+    def search(self,queries,k,blockRows):
+        """Top-k rows for each unit-length query row, best first.
+
+        Scores are computed as one (queries x block) matmul per block of
+        blockRows vectors, upcast to float32 a block at a time so the
+        whole index is never copied out of the map.
+        """
+        with self.lock:
+            self.refresh()
+            matrix,rows=self.matrix,self.rows
+        if matrix is None:
+            return [[] for _ in queries]
+        if queries.shape[1]!=self.dim:
+            raise ValueError(f"query has {queries.shape[1]} dimensions, the index has {self.dim}")
+
+        count=len(matrix)
+        scores=np.empty((len(queries),count),dtype=np.float32)
+        for start in range(0,count,blockRows):
+            block=np.asarray(matrix[start:start+blockRows],dtype=np.float32)
+            scores[:,start:start+len(block)]=queries@block.T
+
+        k=min(k,count)
+        top=np.argpartition(-scores,k-1,axis=1)[:,:k]
+        results=[]
+        with open(self.file('texts.txt'),'rb') as texts:
+            for queryScores,candidates in zip(scores,top):
+                hits=[]
+                for index in candidates[np.argsort(-queryScores[candidates])]:
+                    summaryId,kind,chunk,offset,length=rows[index]
+                    texts.seek(offset)
+                    hits.append({"summary_id":summaryId,"kind":kind,"chunk":chunk,
+                                 "score":round(float(queryScores[index]),4),
+                                 "text":texts.read(length).decode('utf-8')})
+                results.append(hits)
+        return results
+
+
+class summaryVectorIndex:
+    """Per-user semantic index over summaryHistory.
+
+    add() takes history rows once they are committed and returns at once;
+    a worker task splits the source text into EMBED_CHUNK_TOKENS chunks,
+    embeds the summary and its chunks through Ollama in batches of
+    EMBED_BATCH_SIZE and appends the vectors to the user's userVectors.
+    History written before the index existed, or dropped from a full
+    queue, is picked up by sync() the first time the user searches.
+    Indexes are never rebuilt in place; changing EMBED_MODEL starts each
+    user over when their index is next opened.
+    """
+
+    def __init__(self,root=None,model=None):
+        self.root=root or config.VECTOR_INDEX_DIR
+        self.model=model or config.EMBED_MODEL
+        self.users=OrderedDict()
+        self.usersLock=threading.Lock()
+        self.cache=OrderedDict()
+        self.cacheLock=threading.Lock()
+        self.synced=set()
+        self.syncLocks={}
+        self.writeLock=None
+        self.queue=None
+        self.task=None
+        self.loop=None
+        self.metrics={"queued":0,"dropped":0,"indexed":0,"vectors":0,"failed":0,
+                      "embedded":0,"embed_cache_hits":0}
+
+    async def start(self):
+        if not config.VECTOR_INDEX_ENABLED or self.task is not None:
+            return
+        self.loop=asyncio.get_running_loop()
+        self.writeLock=asyncio.Lock()
+        self.queue=asyncio.Queue(maxsize=config.VECTOR_QUEUE_MAXSIZE)
+        self.task=asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is None:
+            return
+        await self.queue.put(None)
+        await self.task
+        self.task=None
+        self.queue=None
+
+    def add(self,items):
+        """Queues historyItems() for indexing; safe to call from any thread."""
+        if self.queue is None or not items:
+            return
+        try:
+            running=asyncio.get_running_loop()
+        except RuntimeError:
+            running=None
+        if running is self.loop:
+            self.enqueue(items)
+        elif not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.enqueue,items)
+
+    def enqueue(self,items):
+        if self.queue is None:
+            return
+        for item in items:
+            try:
+                self.queue.put_nowait(item)
+                self.metrics["queued"]+=1
+            except asyncio.QueueFull:
+                # the user's next search backfills it
+                self.synced.discard(str(item[0]))
+                self.metrics["dropped"]+=1
+
+    async def run(self):
+        stopping=False
+        while not stopping:
+            item=await self.queue.get()
+            if item is None:
+                break
+            batch=[item]
+            while len(batch)<config.EMBED_BATCH_SIZE and not self.queue.empty():
+                item=self.queue.get_nowait()
+                if item is None:
+                    stopping=True
+                    break
+                batch.append(item)
+            try:
+                await self.index(batch)
+            except Exception as e:
+                self.metrics["failed"]+=len(batch)
+                self.synced.difference_update(str(item[0]) for item in batch)
+                logger.error("Indexing %d summaries failed: %s",len(batch),e)
+
+    async def index(self,items):
+        """Embeds and stores (user_id, summary_id, summary, content) items."""
+        items=[(str(userId),str(summaryId),summary,content) for userId,summaryId,summary,content in items]
+        missing=[summaryId for _,summaryId,summary,_ in items if summary is None]
+        if missing:
+            loaded=await self.loadRows(missing)
+            items=[loaded.get(summaryId) if summary is None else (userId,summaryId,summary,content)
+                   for userId,summaryId,summary,content in items]
+
+        async with self.writeLock:
+            entries=[]
+            owners=[]
+            seen=set()
+            for item in items:
+                if item is None or item[1] in seen:
+                    continue
+                userId,summaryId,summary,content=item
+                store=await asyncio.to_thread(self.open,userId)
+                if summaryId in store.summaryIds:
+                    continue
+                seen.add(summaryId)
+                for entry in self.entries(summaryId,summary,content):
+                    entries.append(entry)
+                    owners.append(userId)
+            if not entries:
+                return 0
+
+            vectors=await self.embed([entry[3] for entry in entries])
+            added=0
+            for userId in dict.fromkeys(owners):
+                picks=[index for index,owner in enumerate(owners) if owner==userId]
+                store=await asyncio.to_thread(self.open,userId)
+                added+=await asyncio.to_thread(store.append,[entries[index] for index in picks],vectors[picks])
+            self.metrics["indexed"]+=len(seen)
+            self.metrics["vectors"]+=added
+            return added
+
+    def entries(self,summaryId,summary,content):
+        entries=[(summaryId,'summary',0,summary)]
+        if content:
+            chunks=splitByTokens(content,config.EMBED_CHUNK_TOKENS,config.EMBED_CHUNK_OVERLAP_TOKENS)
+            entries.extend((summaryId,'content',index,chunk) for index,chunk in enumerate(chunks[:config.EMBED_MAX_CHUNKS]))
+        return entries
+
+    async def loadRows(self,summaryIds):
+        async with asyncPostgresDb() as pg:
+            rows=await pg.showData(loadRowsQuery,(summaryIds,))
+        if not isinstance(rows,list):
+            raise RuntimeError(f"loading summaries failed: {rows.get('data')}")
+        loaded={}
+        for userId,summaryId,summary,content,codec,data in rows:
+            if summary is not None:
+                loaded[str(summaryId)]=(str(userId),str(summaryId),summary,
+                                        await asyncio.to_thread(storedContent,content,codec,data))
+        return loaded
+
+    async def embed(self,texts):
+        """Unit-length float32 rows for texts; repeated texts come from the cache."""
+        keys=[hashlib.sha256(text.encode('utf-8')).digest() for text in texts]
+        vectors=[None]*len(texts)
+        pending={}
+        with self.cacheLock:
+            for index,key in enumerate(keys):
+                cached=self.cache.get(key)
+                if cached is None:
+                    pending.setdefault(key,[]).append(index)
+                    continue
+                self.cache.move_to_end(key)
+                vectors[index]=cached
+                self.metrics["embed_cache_hits"]+=1
+
+        model=modelRegistry.embeddingModel()
+        pendingKeys=list(pending)
+        for start in range(0,len(pendingKeys),config.EMBED_BATCH_SIZE):
+            batch=pendingKeys[start:start+config.EMBED_BATCH_SIZE]
+            with metricsRegistry.span('embed'):
+                embedded=await model.aembed_documents([texts[pending[key][0]] for key in batch])
+            rows=unitRows(embedded).astype(vectorDtype)
+            self.metrics["embedded"]+=len(batch)
+            with self.cacheLock:
+                for key,row in zip(batch,rows):
+                    for index in pending[key]:
+                        vectors[index]=row
+                    self.cache[key]=row
+                while len(self.cache)>config.EMBED_CACHE_SIZE:
+                    self.cache.popitem(last=False)
+        return np.asarray(vectors,dtype=np.float32)
+
+    def open(self,userId):
+        userId=str(userId)
+        with self.usersLock:
+            store=self.users.get(userId)
+            if store is not None:
+                self.users.move_to_end(userId)
+                return store
+        store=userVectors(os.path.join(self.root,userId),self.model)
+        with self.usersLock:
+            store=self.users.setdefault(userId,store)
+            self.users.move_to_end(userId)
+            while len(self.users)>config.VECTOR_OPEN_USERS:
+                self.users.popitem(last=False)
+        return store
+
+    async def sync(self,userId):
+        """Indexes the user's history rows that are not in the index yet."""
+        userId=str(userId)
+        if userId in self.synced:
+            return 0
+        lock=self.syncLocks.setdefault(userId,asyncio.Lock())
+        async with lock:
+            if userId in self.synced:
+                return 0
+            async with asyncPostgresDb() as pg:
+                rows=await pg.showData(userSummaryIdsQuery,(userId,))
+            if not isinstance(rows,list):
+                raise RuntimeError(f"listing summaries failed: {rows.get('data')}")
+            store=await asyncio.to_thread(self.open,userId)
+            missing=[str(summaryId) for summaryId, in rows if str(summaryId) not in store.summaryIds]
+            for start in range(0,len(missing),config.EMBED_BATCH_SIZE):
+                await self.index([(userId,summaryId,None,None) for summaryId in missing[start:start+config.EMBED_BATCH_SIZE]])
+            self.synced.add(userId)
+            if missing:
+                logger.info("Backfilled %d summaries into the vector index of user %s",len(missing),userId)
+            return len(missing)
+
+    async def search(self,userId,texts,k=None):
+        """Top-k hits per query text across the user's summaries and content."""
+        if self.writeLock is None:
+            raise RuntimeError("vector index is disabled")
+        await self.sync(userId)
+        queries=unitRows(await self.embed(texts))
+        store=await asyncio.to_thread(self.open,userId)
+        with metricsRegistry.span('vector_search'):
+            return await asyncio.to_thread(store.search,queries,k or config.VECTOR_TOP_K,config.VECTOR_SEARCH_BLOCK_ROWS)
+
+    def stats(self):
+        with self.usersLock:
+            openUsers=len(self.users)
+        return {"enabled":self.task is not None,
+                "model":self.model,
+                "queue_depth":self.queue.qsize() if self.queue else 0,
+                "open_users":openUsers,
+                "embed_cache_entries":len(self.cache),
+                **self.metrics}
+
+
+vectorIndex = summaryVectorIndex()